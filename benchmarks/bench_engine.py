@@ -0,0 +1,272 @@
+"""
+Benchmark suite of the fast_bt event loop
+
+    python benchmarks/bench_engine.py --dates 250 1000 --sids 500 5000 \
+        --engines pandas array sparse vectorized --output results.json
+
+For every (dates, sids, engine) case a synthetic MultiIndex price panel and a
+target-weight holding are generated from a fixed seed, then a HoldingStrategy
+(VectorizedHoldingStrategy for the vectorized engine) is built and run in a
+fresh process, so that peak RSS of one case is not polluted by another.
+
+Reported per case:
+
+    warmup_sec         loading / compiling the numba kernels, excluded from run_sec
+    build_sec          BacktestDataSource + strategy construction
+    run_sec            FastStrategy.run
+    bars_per_sec       dates / run_sec
+    <stage>_sec        cumulative wall time of each StageProfiler stage: quote,
+                       on_quote (fill_order, update_by_order, update_by_price),
+                       on_data, post_day; only for the event loop engines
+    summary_sec        history_summary assembly
+    rss_base_mb        resident memory after the panel is generated
+    peak_rss_mb        peak resident memory of the case process
+    traced_peak_mb     peak of python allocations traced during run (tracemalloc)
+    alloc_blocks_per_bar, alloc_kb_per_bar
+                       net memory blocks / KB still allocated after run, per bar,
+                       i.e. how much the history grows with every bar
+
+Before the timings, the vectorized engine is checked against the array event
+loop on the smallest case, once with the liquidity cap lifted (amount scaled
+up) and once with the cap binding; the summaries must agree to 1e-10.
+
+The stage timings come from a second, profiled run and the allocation figures
+from a third, traced run, so run_sec is affected by neither. Use --no-trace to skip it. Results are written as
+json (environment and a list of records) or csv depending on the extension
+of --output.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_bt import BacktestDataSource, HoldingStrategy, StrategyEnvironment, VectorizedHoldingStrategy  # noqa: E402
+from fast_bt.kernels import HAS_NUMBA, fill_arrays, rebalance_shares  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+ENGINES = ('pandas', 'array', 'sparse', 'vectorized')
+STAGES = ('quote', 'on_quote', 'fill_order', 'update_by_order', 'update_by_price', 'on_data', 'post_day')
+
+
+def make_panel(n_dates, n_sids, holding_num=None, rebalance_every=5, seed=0):
+    """
+    Synthetic price panel and holding
+
+    Parameters
+    ----------
+    n_dates, n_sids: int
+        panel size
+    holding_num: int, optional
+        number of names held at each rebalance, default 10% of n_sids
+    rebalance_every: int
+        rebalance frequency in bars
+    seed: int
+
+    Returns
+    -------
+    prcs: pd.DataFrame
+        index (date, sid), columns open, close, vwap, amount
+    holding: pd.DataFrame
+        equal-weight target holding, date * sid
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2010-01-01', periods=n_dates, name='date')
+    sids = pd.Index(['%06d' % i for i in range(n_sids)], name='sid')
+    close = 10. * np.exp(np.cumsum(rng.normal(0., 0.02, (n_dates, n_sids)), axis=0))
+    # 停牌
+    close[rng.random((n_dates, n_sids)) < 0.01] = np.nan
+    prcs = pd.DataFrame({
+        'open': (close * (1. + rng.normal(0., 0.005, close.shape))).ravel(),
+        'close': close.ravel(),
+        'vwap': (close * (1. + rng.normal(0., 0.003, close.shape))).ravel(),
+        'amount': rng.uniform(1e6, 1e8, close.shape).ravel(),
+    }, index=pd.MultiIndex.from_product([dates, sids]))
+
+    holding_num = holding_num or max(1, n_sids // 10)
+    rebalance_dates = dates[::rebalance_every]
+    score = rng.random((len(rebalance_dates), n_sids))
+    selected = score >= -np.partition(-score, holding_num - 1, axis=1)[:, holding_num - 1:holding_num]
+    holding = pd.DataFrame(np.where(selected, 1. / holding_num, np.nan), index=rebalance_dates, columns=sids)
+    return prcs, holding
+
+
+def _rss_mb():
+    """current resident memory, None if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _build(prcs, holding, engine, use_numba):
+    ds = BacktestDataSource(prcs, dense=engine != 'pandas')
+    env = StrategyEnvironment(init_cash=1e8, engine=engine, use_numba=use_numba)
+    if engine == 'vectorized':
+        return VectorizedHoldingStrategy(ds, env, 'bench', holding)
+    return HoldingStrategy(ds, env, 'bench', holding)
+
+
+def run_case(n_dates, n_sids, engine, holding_num=None, rebalance_every=5, seed=0, use_numba=True, trace=True):
+    """
+    Run one benchmark case in the current process
+
+    Returns
+    -------
+    dict
+        one record of the results
+    """
+    prcs, holding = make_panel(n_dates, n_sids, holding_num, rebalance_every, seed)
+    res = {'engine': engine, 'dates': n_dates, 'sids': n_sids, 'holding_num': int(holding.notna().sum(axis=1).max()),
+           'rebalance_every': rebalance_every, 'numba': bool(use_numba and HAS_NUMBA), 'rss_base_mb': _rss_mb()}
+
+    start = time.perf_counter()
+    x = np.ones(2)
+    fill_arrays(x, x, x, 0., 0., 1., use_numba=use_numba)
+    fill_arrays(x, x, None, 0., 0., 1., use_numba=use_numba)
+    rebalance_shares(x, x, x, 1., use_numba=use_numba)
+    res['warmup_sec'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    str_inst = _build(prcs, holding, engine, use_numba)
+    res['build_sec'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    str_inst.run(progress=False)
+    res['run_sec'] = time.perf_counter() - start
+    res['bars_per_sec'] = n_dates / res['run_sec']
+
+    start = time.perf_counter()
+    summary = str_inst.history_summary()
+    res['summary_sec'] = time.perf_counter() - start
+    res['final_nav'] = float(summary['nav'].iloc[-1])
+    res['peak_rss_mb'] = _peak_rss_mb()
+    del str_inst, summary
+
+    for k in STAGES:
+        res[k + '_sec'] = None
+    if engine != 'vectorized':
+        str_inst = _build(prcs, holding, engine, use_numba)
+        profiler = str_inst.enable_profiling()
+        str_inst.run(progress=False)
+        for k in STAGES:
+            res[k + '_sec'] = profiler.total.get(k, 0.)
+
+    res['traced_peak_mb'] = res['alloc_blocks_per_bar'] = res['alloc_kb_per_bar'] = None
+    if trace:
+        str_inst = _build(prcs, holding, engine, use_numba)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        str_inst.run(progress=False)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        res['traced_peak_mb'] = peak / 2 ** 20
+        res['alloc_blocks_per_bar'] = sum(x.count_diff for x in stats) / n_dates
+        res['alloc_kb_per_bar'] = sum(x.size_diff for x in stats) / 2 ** 10 / n_dates
+    return res
+
+
+def check_equivalence(n_dates, n_sids, holding_num=None, rebalance_every=5, seed=0, use_numba=True):
+    """
+    Assert the vectorized engine reproduces the array engine
+
+    Raises
+    ------
+    AssertionError
+        with the largest relative deviation of history_summary
+    """
+    prcs, holding = make_panel(n_dates, n_sids, holding_num, rebalance_every, seed)
+    for scale in (1e6, 1.):
+        panel = prcs.assign(amount=prcs['amount'] * scale)
+        summaries = []
+        for engine in ('array', 'vectorized'):
+            str_inst = _build(panel, holding, engine, use_numba)
+            str_inst.run(progress=False)
+            summaries.append(str_inst.history_summary())
+        expected, actual = summaries
+        err = ((actual - expected).abs() / (expected.abs() + 1.)).max().max()
+        assert err < 1e-10, "vectorized deviates from array by {:.3g} (amount x {:g})".format(err, scale)
+
+
+def _environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'numba_installed': HAS_NUMBA, 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def write_results(records, path):
+    """write the records to json or csv by the extension of path"""
+    if path.endswith('.csv'):
+        pd.DataFrame(records).to_csv(path, index=False)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'environment': _environment(), 'results': records}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dates', type=int, nargs='+', default=[250])
+    parser.add_argument('--sids', type=int, nargs='+', default=[500, 2000])
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=ENGINES)
+    parser.add_argument('--holding-num', type=int, default=None, help='names per rebalance, default 10%% of sids')
+    parser.add_argument('--rebalance-every', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-numba', action='store_true', help='use the NumPy kernels')
+    parser.add_argument('--no-trace', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--in-process', action='store_true', help='run every case in this process')
+    parser.add_argument('--output', default=None, help='results file, .json or .csv')
+    args = parser.parse_args()
+
+    if 'vectorized' in args.engines:
+        check_equivalence(min(args.dates), min(args.sids), args.holding_num, args.rebalance_every, args.seed,
+                          use_numba=not args.no_numba)
+
+    records = []
+    for n_dates, n_sids, engine in itertools.product(args.dates, args.sids, args.engines):
+        kwargs = dict(n_dates=n_dates, n_sids=n_sids, engine=engine, holding_num=args.holding_num,
+                      rebalance_every=args.rebalance_every, seed=args.seed, use_numba=not args.no_numba,
+                      trace=not args.no_trace)
+        if args.in_process:
+            res = run_case(**kwargs)
+        else:
+            # 每个case一个新进程, peak RSS互不影响
+            with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+                res = pool.submit(run_case, **kwargs).result()
+        records.append(res)
+        print('{engine:>10} {dates:>6} x {sids:<6} {bars_per_sec:>10.1f} bars/s  run {run_sec:.3f}s  '
+              'peak rss {peak_rss_mb}MB'.format(**res), file=sys.stderr)
+
+    if args.output:
+        write_results(records, args.output)
+    else:
+        print(pd.DataFrame(records).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of the fill and rebalance kernels against the pandas implementation
+
+    python benchmarks/bench_kernels.py [--sizes 1000 5000 20000] [--repeat 50]
+
+For each universe size a random target / position / quote snapshot is built and
+the following are timed per call:
+
+    pandas: FillStrategy.fill_order on pd.Series and the pandas rebalance arithmetic
+    numpy:  fill_arrays / rebalance_shares with use_numba=False
+    numba:  fill_arrays / rebalance_shares with the compiled kernels (if installed)
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_bt.context import TradingParam  # noqa: E402
+from fast_bt.fill import FillStrategy  # noqa: E402
+from fast_bt.kernels import HAS_NUMBA, fill_arrays, rebalance_shares  # noqa: E402
+from fast_bt.order import Order  # noqa: E402
+
+
+def make_snapshot(n, seed=0):
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(5., 100., n)
+    price[rng.random(n) < 0.02] = np.nan
+    amount = rng.uniform(1e6, 1e8, n)
+    target = rng.random(n)
+    target /= target.sum()
+    pos = np.trunc(rng.uniform(-1., 1., n) * 1e4)
+    return price, amount, target, pos
+
+
+def timeit(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def pandas_rebalance(target, pos, prc, total_value, corridor):
+    dif = target.fillna(0.) * total_value - prc * pos
+    dif = (dif[dif.abs() > corridor] / prc).dropna()
+    return dif.astype(int)
+
+
+def bench(n, repeat, param):
+    price, amount, target, pos = make_snapshot(n)
+    sids = pd.Index(['%06d' % i for i in range(n)], name='sid')
+    total_value = 1e9
+    quantity = rebalance_shares(target, pos, price, total_value, use_numba=False)
+    fill = FillStrategy('vwap', param)
+    s_quote = {'vwap': pd.Series(price, index=sids), 'amount': pd.Series(amount, index=sids)}
+    s_quantity = pd.Series(quantity, index=sids)
+    s_target, s_pos, s_price = (pd.Series(x, index=sids) for x in (target, pos, price))
+    args = (param.sllipage, param.commission, param.max_trading_percentage)
+
+    res = {'n': n}
+    res['pandas_fill'] = timeit(lambda: fill.fill_order(Order(s_quantity, None), s_quote), repeat)
+    res['pandas_rebalance'] = timeit(lambda: pandas_rebalance(s_target, s_pos, s_price, total_value, 0.), repeat)
+    res['numpy_fill'] = timeit(lambda: fill_arrays(quantity, price, amount, *args, use_numba=False), repeat)
+    res['numpy_rebalance'] = timeit(lambda: rebalance_shares(target, pos, price, total_value, use_numba=False),
+                                    repeat)
+    if HAS_NUMBA:
+        res['numba_fill'] = timeit(lambda: fill_arrays(quantity, price, amount, *args), repeat)
+        res['numba_rebalance'] = timeit(lambda: rebalance_shares(target, pos, price, total_value), repeat)
+        # the compiled kernels follow the NumPy semantics
+        a = fill_arrays(quantity, price, amount, *args, use_numba=False)
+        b = fill_arrays(quantity, price, amount, *args)
+        assert np.array_equal(a[1], b[1]) and np.allclose(a[2:], b[2:])
+        assert np.array_equal(rebalance_shares(target, pos, price, total_value, use_numba=False),
+                              rebalance_shares(target, pos, price, total_value))
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    param = TradingParam()
+    rows = [bench(n, args.repeat, param) for n in args.sizes]
+    res = pd.DataFrame(rows).set_index('n') * 1e6
+    print('us per call, numba installed: %s' % HAS_NUMBA)
+    print(res.round(1).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,12 @@ A broker
 import logging
 from copy import deepcopy
 
+import numpy as np
 import pandas as pd
 
+from .order import Order
 from .portfolio import Portfolio
-from .context import Context
+from .sparse import SparseVector
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +19,31 @@ class Broker:
     """
     模拟 Broker 接收撮合订单
 
+    recorder给定时为array引擎: 仓位与订单均为以sid id为下标的定长np.ndarray,
+    每日的组合信息写入预先分配的HistoryRecorder, 而不是下面的各个dict
+    recorder为SparseHistoryRecorder时为sparse引擎: 仓位与订单均为SparseVector
+    incremental_valuation为True时持仓与价格未变化的bar不重新计算组合价值
+
+    carry_over为True时使用order book: 订单中因成交额上限未成交的部分不撤销, 保留decay比例(按整股截断)
+    到下一个bar继续撮合; 每个bar新下的订单并入order book, 整个order book合并为一个订单一次撮合.
+    cancel_order (如rebalance) 同时清空order book. 此时未成交订单只记录按decay舍弃的部分,
+    每个bar结束后留在order book中的数量记录在self.book
 
     """
-    def __init__(self, init_cash, fill_strategy):
+    def __init__(self, init_cash, fill_strategy, context, recorder=None, incremental_valuation=False,
+                 carry_over=False, decay=1.):
+        # 所属策略的Context
+        self.context = context
+        # 历史记录 (array引擎)
+        self.recorder = recorder
+        # 分阶段计时, 由策略设置
+        self.profiler = None
         # 投资组合
-        self.portfolio = Portfolio(init_cash)
+        if recorder is None:
+            self.portfolio = Portfolio(init_cash, context, incremental=incremental_valuation)
+        else:
+            self.portfolio = Portfolio(init_cash, context, recorder.n_sids, recorder.sparse,
+                                       incremental=incremental_valuation)
         # 成交模型
         self.__fill_strategy = fill_strategy
         # 成功执行的订单 / 时间切片数据，只在当日有效
@@ -30,6 +52,10 @@ class Broker:
         self.__cancelled_order = []
         # 等待执行的订单 / 时间切片数据，只在当日有效
         self.__active_orders = []
+        # order book: 上一个bar未成交、留到当前bar继续撮合的数量 (carry_over)
+        self.carry_over = carry_over
+        self.decay = decay
+        self.__book = None
         # 持仓
         self.pos = dict()
         # 成交订单
@@ -50,6 +76,8 @@ class Broker:
         self.turnover = dict()
         # 下的订单
         self.placed_order = []
+        # 每个bar结束后留在order book中的数量 (carry_over)
+        self.book = dict()
 
     def place_order(self, order):
         """
@@ -65,6 +93,7 @@ class Broker:
 
         """
         self.__active_orders = []
+        self.__book = None
 
     def _list_active_orders(self):
         """
@@ -79,58 +108,134 @@ class Broker:
         1. 撮合上一阶段订单
         2. 更新portfolio价格
         """
+        prof = self.profiler
+        if self.carry_over:
+            orders = self.__merge_book()
+        else:
+            orders = self.__active_orders
+            self.placed_order.extend(orders)
+        # 所有订单在本bar撮合
+        self.__active_orders = []
         # 判断是否有订单
-        if self.__active_orders:
-            quote = Context.cur_quote
-            for order in self.__active_orders:
-                # 撮合订单, 并返回未成交的订单
-                unfilled = self.__fill_strategy.fill_order(order, quote)
-                # 根据撮合结果更新投资组合信息
-                self.portfolio.update_by_order(order)
+        if orders:
+            quote = self.context.cur_quote
+            for order in orders:
+                if prof is None:
+                    # 撮合订单, 并返回未成交的订单
+                    unfilled = self.__fill_strategy.fill_order(order, quote)
+                    # 根据撮合结果更新投资组合信息
+                    self.portfolio.update_by_order(order)
+                else:
+                    unfilled = prof.call('fill_order', self.__fill_strategy.fill_order, order, quote)
+                    prof.call('update_by_order', self.portfolio.update_by_order, order)
+                if self.carry_over:
+                    # 留在order book中的部分不算未成交, 只记录按decay舍弃的部分
+                    self.__book, unfilled = self.__carry(unfilled)
                 # 订单中未能成功执行的部分
                 self.__cancelled_order.append(unfilled)
                 # 订单中执行成功的部分
                 self.__filled_order.append(order)
-                self.__active_orders = [
-                    order for order in self.__active_orders if order.status == 'unfilled'
-                ]
-                self.placed_order.append(order)
-        self.portfolio.update_by_price()
+        if prof is None:
+            self.portfolio.update_by_price()
+        else:
+            prof.call('update_by_price', self.portfolio.update_by_price)
+
+    def __merge_book(self):
+        """
+        新下的订单并入order book
+
+        Returns
+        -------
+        list of Order
+            当前bar需要撮合的订单, 至多一个
+        """
+        quantities = [order.quantity for order in self.__active_orders]
+        self.placed_order.extend(self.__active_orders)
+        if self.__book is not None:
+            quantities.append(self.__book)
+            self.__book = None
+        if not quantities:
+            return []
+        quantity = quantities[0]
+        for x in quantities[1:]:
+            if isinstance(quantity, SparseVector):
+                quantity = quantity.add(x)
+            elif isinstance(quantity, np.ndarray):
+                quantity = quantity + x
+            else:
+                quantity = quantity.add(x, fill_value=0.)
+        if len(quantities) > 1 and isinstance(quantity, pd.Series):
+            quantity = quantity[quantity != 0.]
+        return [Order(quantity, self.context.cur_time)]
+
+    def __carry(self, unfilled):
+        """
+        未成交部分保留decay比例(按整股截断)到下一个bar
+
+        Returns
+        -------
+        book: 与unfilled同类型, 为空时为None
+            留到下一个bar的order book
+        dropped: 与unfilled同类型
+            舍弃(撤销)的部分
+        """
+        if isinstance(unfilled, SparseVector):
+            values = np.nan_to_num(unfilled.values)
+            kept = np.trunc(values * self.decay)
+            book = SparseVector(unfilled.ids, kept, unfilled.n).nonzero()
+            dropped = SparseVector(unfilled.ids, values - kept, unfilled.n).nonzero()
+            return (book if len(book) else None), dropped
+        if isinstance(unfilled, np.ndarray):
+            values = np.nan_to_num(unfilled)
+            kept = np.trunc(values * self.decay)
+            return (kept if kept.any() else None), values - kept
+        values = unfilled.fillna(0.)
+        kept = np.trunc(values * self.decay)
+        dropped = values - kept
+        book = kept[kept != 0.]
+        return (None if book.empty else book), dropped[dropped != 0.]
 
     def post_day(self):
         """
         在当日结束后记录组合信息
 
         """
+        if self.__book is not None:
+            self.book[self.context.cur_time] = self.__book
+        if self.recorder is not None:
+            self.recorder.record(self.portfolio, self.__filled_order, self.__cancelled_order)
+            self.__filled_order = list()
+            self.__cancelled_order = list()
+            return
         # 仓位记录
-        self.pos.update({Context.cur_time: self.portfolio.pos})
+        self.pos.update({self.context.cur_time: self.portfolio.pos})
         # 记录成交订单记录
         if self.__filled_order:
-            filled_order = pd.Series()
+            filled_order = pd.Series(dtype=float)
             trn_cost = 0.
             trn_amount = 0.
             for order in self.__filled_order:
                 filled_order = filled_order.add(order.filled_quantity, fill_value=0.)
                 trn_cost = trn_cost + order.transaction_cost
                 trn_amount = trn_amount + order.abs_transaction_amount
-            self.filled_order.update({Context.cur_time: filled_order})
-            self.transaction_cost.update({Context.cur_time: trn_cost})
-            self.turnover.update({Context.cur_time: trn_amount})
+            self.filled_order.update({self.context.cur_time: filled_order})
+            self.transaction_cost.update({self.context.cur_time: trn_cost})
+            self.turnover.update({self.context.cur_time: trn_amount})
         # 记录未成交订单记录
         if self.__cancelled_order:
-            unfilled_order = pd.Series()
+            unfilled_order = pd.Series(dtype=float)
             for order in self.__cancelled_order:
                 unfilled_order = unfilled_order.add(order, fill_value=0.)
-            self.unfilled_order.update({Context.cur_time: unfilled_order})
+            self.unfilled_order.update({self.context.cur_time: unfilled_order})
 
         # 现金记录
-        self.cash.update({Context.cur_time: self.portfolio.cash})
+        self.cash.update({self.context.cur_time: self.portfolio.cash})
         # 可实现价值记录
-        self.realizable_value.update({Context.cur_time: self.portfolio.realizable_value})
+        self.realizable_value.update({self.context.cur_time: self.portfolio.realizable_value})
         # 成本价值记录
-        self.cost_value.update({Context.cur_time: self.portfolio.cost_value})
+        self.cost_value.update({self.context.cur_time: self.portfolio.cost_value})
         # 总市值
-        self.market_value.update({Context.cur_time: self.portfolio.market_value})
+        self.market_value.update({self.context.cur_time: self.portfolio.market_value})
 
         # 清空当日信息
 
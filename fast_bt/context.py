@@ -1,11 +1,14 @@
 """
-Constant variable
+Per-run variable
 """
 
 
 class Context:
     """
-    The Global variable to keep track of current market quote
+    Keep track of current market quote of one backtest run
+
+    Each strategy owns its Context, which is passed to its Broker and Portfolio,
+    so that backtests in the same process do not overwrite each other
 
     Atttribute
     ----------
@@ -13,24 +16,36 @@ class Context:
         current time
     pre_time: pd.Timestamp
         time one step ago
-    cur_prc: dict
+    cur_quote: dict
         current market quote, each key should be a field (price, volume, etc) in pd.Series
-    pre_prc: dict
+    pre_quote: dict
         previous market quote
     """
-    cur_time = None
-    pre_time = None
-    cur_quote = {}
-    pre_quote = {}
+    def __init__(self):
+        self.cur_time = None
+        self.pre_time = None
+        self.cur_quote = {}
+        self.pre_quote = {}
 
 
 class TradingParam:
     """
-    Constant used across backtest
+    Trading parameter used across one backtest
+
+    The class attributes are the defaults, instances are owned by StrategyEnvironment
+    and passed to FillStrategy
     """
     # sllipage
     sllipage = 0.002
     # commission
     commission = 0.001
     # max percentage of the snapshot's amount that are allowed 
-    max_trading_percentage = 0.05
\ No newline at end of file
+    max_trading_percentage = 0.05
+
+    def __init__(self, sllipage=None, commission=None, max_trading_percentage=None):
+        if sllipage is not None:
+            self.sllipage = sllipage
+        if commission is not None:
+            self.commission = commission
+        if max_trading_percentage is not None:
+            self.max_trading_percentage = max_trading_percentage
@@ -3,7 +3,7 @@ Object to deal with data
 """
 
 import os
-import copy
+import json
 
 import numpy as np
 import pandas as pd
@@ -13,9 +13,20 @@ import pandas as pd
 class BacktestDataSource:
     """
     data source 
+
+    A datasource is read-only once built: the dense panel arrays are frozen
+    (writeable=False), so are the numpy blocks of the quote frame. The frame is
+    a shallow copy of the caller's data, so that with copy-on-write later
+    modifications of the caller's frame through pandas are not seen by the
+    datasource, while writes into the frozen arrays raise. A fingerprint of the
+    frame (shape, index and the identity of every block) is kept and verified
+    by check_unchanged at the start and end of every run, which catches
+    modifications of self.data through pandas (they have to replace a frozen
+    block). Strategies therefore share a datasource by reference, copy.deepcopy
+    returns the datasource itself
     """
 
-    def __init__(self, data, start_date=None, end_date=None, sids_list=None):
+    def __init__(self, data, start_date=None, end_date=None, sids_list=None, dense=False):
         """
         Data source
 
@@ -25,18 +36,216 @@ class BacktestDataSource:
                             open	    close	    vwap	    amount
         date	    sid				
         2010-01-04	000001	830.053576	802.633372	811.939526	5.802495e+08
+
+        If dense is True, the quotes are additionally laid out once as a dense panel:
+        one date * sid float array per field, sharing fixed date and sid indexes.
+        Quotes of each bar are then zero-copy row views of the panel (see quote_at)
+
+        data is not copied, the datasource keeps a shallow copy (or the subset
+        selected by start_date, end_date and sids_list) whose numpy blocks are
+        made read-only
         """
-        self.data = copy.deepcopy(data)
+        self.data = data
         if start_date is not None:
             self.data = self.data.loc[pd.Timestamp(start_date): ]
         if end_date is not None:
             self.data = self.data.loc[:pd.Timestamp(end_date)]
         if sids_list is not None:
-            self.data = self.data.query("sid in {}".format(
-                str(tuple(sids_list)).replace(',)', ')')
-            ))
+            self.data = self.data[self.data.index.get_level_values('sid').isin(sids_list)]
 
         self._check_valid(self.data)
+        self.data = self.data.copy(deep=False)
+        self._fingerprint = self._freeze_frame(self.data)
+
+        # dense panel: field -> date * sid array
+        self.dense = dense
+        self.dates = None
+        self.sids = None
+        self.panel = None
+        if dense:
+            self._build_panel()
+
+    @classmethod
+    def from_panel(cls, panel, dates, sids):
+        """
+        Build a dense datasource directly from a panel without the MultiIndex frame
+
+        The panel is shared by reference (e.g. arrays backed by shared memory
+        or memmap) through read-only views and is never copied, self.data is None
+
+        Parameters
+        ----------
+        panel: dict
+            field -> date * sid np.ndarray
+        dates: pd.DatetimeIndex
+        sids: pd.Index
+        """
+        assert "close" in panel, "close is a requred field"
+        ds = cls.__new__(cls)
+        ds.data = None
+        ds._fingerprint = None
+        ds.dense = True
+        ds.dates = dates
+        ds.sids = sids
+        ds.panel = {k: cls._freeze(v) for k, v in panel.items()}
+        return ds
+
+    @staticmethod
+    def _freeze_frame(data):
+        """
+        mark the numpy blocks of data read-only
+
+        Returns
+        -------
+        tuple
+            fingerprint: shape, index, columns and the block arrays, compared by identity
+        """
+        blocks = [b.values for b in data._mgr.blocks]
+        for v in blocks:
+            if isinstance(v, np.ndarray):
+                v.flags.writeable = False
+        return data.shape, data.index, data.columns, blocks
+
+    def check_unchanged(self):
+        """assert the quote frame has not been modified since the datasource was built"""
+        if self.data is None:
+            return
+        shape, index, columns, blocks = self._fingerprint
+        cur = [b.values for b in self.data._mgr.blocks]
+        assert self.data.shape == shape and self.data.index is index and self.data.columns is columns \
+            and len(cur) == len(blocks) and all(x is y for x, y in zip(cur, blocks)), \
+            "the quote frame of the datasource has been modified after it was built"
+
+    @staticmethod
+    def _freeze(arr):
+        """read-only view of arr, the flags of arr itself are not changed"""
+        arr = arr.view()
+        arr.flags.writeable = False
+        return arr
+
+    def to_disk(self, path):
+        """
+        Save the dense panel as an on-disk columnar store
+
+        Each field is saved as <field>.npy (date * sid float array), together with
+        dates.npy, sids.npy and meta.json, so that it can be opened by from_disk
+        with np.memmap
+
+        Parameters
+        ----------
+        path: str
+            directory of the store, created if not exist
+        """
+        assert self.dense, "to_disk requires a dense datasource"
+        os.makedirs(path, exist_ok=True)
+        for k, v in self.panel.items():
+            np.save(os.path.join(path, '{}.npy'.format(k)), np.ascontiguousarray(v, dtype=float))
+        np.save(os.path.join(path, 'dates.npy'), self.dates.values.astype('datetime64[ns]'))
+        np.save(os.path.join(path, 'sids.npy'), np.asarray(self.sids, dtype=str))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'fields': list(self.panel)}, f)
+
+    @classmethod
+    def from_disk(cls, path, start_date=None, end_date=None, sids_list=None):
+        """
+        Open an on-disk store saved by to_disk with np.memmap (read only)
+
+        Date range subsetting is a zero-copy slice of the memmap, so that processes
+        opening the same store share the OS page cache. sids_list is a zero-copy
+        slice as well when the selected sids are contiguous in the store, otherwise
+        the selected columns are gathered into memory
+
+        Parameters
+        ----------
+        path: str
+            directory of the store
+        start_date, end_date: str, timestamp, optional
+        sids_list: list, optional
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            fields = json.load(f)['fields']
+        dates = pd.DatetimeIndex(np.load(os.path.join(path, 'dates.npy')), name='date')
+        sids = pd.Index(np.load(os.path.join(path, 'sids.npy')), name='sid')
+
+        # date range -> slice
+        t0 = 0 if start_date is None else dates.searchsorted(pd.Timestamp(start_date), side='left')
+        t1 = len(dates) if end_date is None else dates.searchsorted(pd.Timestamp(end_date), side='right')
+        # sids -> slice if contiguous
+        s_idx = slice(None)
+        if sids_list is not None:
+            loc = np.sort(sids.get_indexer(pd.Index(sids_list).unique()))
+            loc = loc[loc >= 0]
+            if len(loc) > 0 and loc[-1] - loc[0] + 1 == len(loc):
+                s_idx = slice(loc[0], loc[-1] + 1)
+            else:
+                s_idx = loc
+
+        panel = dict()
+        for k in fields:
+            arr = np.load(os.path.join(path, '{}.npy'.format(k)), mmap_mode='r')
+            panel[k] = arr[t0:t1][:, s_idx]
+        return cls.from_panel(panel, dates[t0:t1], sids[s_idx])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_fingerprint']
+        return state
+
+    def __setstate__(self, state):
+        # arrays are writeable again after unpickling
+        self.__dict__.update(state)
+        self._fingerprint = None if self.data is None else self._freeze_frame(self.data)
+        if self.panel is not None:
+            self.panel = {k: self._freeze(v) for k, v in self.panel.items()}
+
+    def __copy__(self):
+        # read-only, shared by reference
+        return self
+
+    def __deepcopy__(self, memo):
+        # read-only, shared by reference
+        return self
+
+    def _build_panel(self):
+        """lay out the MultiIndex quotes as a dense date * sid array per field"""
+        date_values = self.data.index.get_level_values('date')
+        sid_values = self.data.index.get_level_values('sid')
+        self.dates = pd.DatetimeIndex(date_values.unique()).sort_values()
+        self.sids = pd.Index(sid_values.unique()).sort_values()
+
+        t_idx = self.dates.get_indexer(date_values)
+        s_idx = self.sids.get_indexer(sid_values)
+        shape = (len(self.dates), len(self.sids))
+
+        self.panel = dict()
+        for k in self.data:
+            arr = np.full(shape, np.nan)
+            arr[t_idx, s_idx] = self.data[k].to_numpy(dtype=float)
+            arr.flags.writeable = False
+            self.panel[k] = arr
+
+    def quote_at(self, i, raw=False):
+        """
+        Quote of the i-th bar of the dense panel
+
+        Parameters
+        ----------
+        i: int
+            position of the bar in self.dates
+        raw: bool
+            if True return np.ndarray row views aligned with self.sids,
+            otherwise wrap the same views in pd.Series (no copy)
+
+        Returns
+        -------
+        dict
+            field -> quote of the bar
+        """
+        assert self.dense, "quote_at requires a dense datasource"
+        if raw:
+            return {k: v[i] for k, v in self.panel.items()}
+        return {k: pd.Series(v[i], index=self.sids, name=k, copy=False)
+                for k, v in self.panel.items()}
 
 
     @staticmethod
@@ -6,12 +6,27 @@ import numpy as np
 import pandas as pd
 
 from .context import TradingParam
+from .sparse import SparseVector
+from .kernels import fill_arrays
 
 
 class FillStrategy:
-    """Method to fill, should consider transaction cost here"""
-    def __init__(self, fill_method):
+    """
+    Method to fill, should consider transaction cost here
+
+    Parameters
+    ----------
+    fill_method: str
+        price used to fill: vwap, close, open ...
+    trading_param: TradingParam, optional
+        sllipage, commission and max trading percentage of the run, default TradingParam()
+    use_numba: bool
+        use the numba compiled kernel for the array and sparse engines when numba is installed
+    """
+    def __init__(self, fill_method, trading_param=None, use_numba=True):
         self.fill_method = fill_method
+        self.trading_param = TradingParam() if trading_param is None else trading_param
+        self.use_numba = use_numba
 
     def fill_order(self, order, quote):
         """
@@ -28,10 +43,6 @@ class FillStrategy:
             Order instance
         quote: dict
             market quote of the snapshot
-        sllipage: float
-            slippage, as percentage
-        commission: float
-            commission, as percentage
 
         Return
         ------
@@ -44,16 +55,18 @@ class FillStrategy:
             order.price = quote[self.fill_method]
         else:
             raise Exception("Illegit price type")
+        if order.status == 'unfilled' and isinstance(order.quantity, (np.ndarray, SparseVector)):
+            return self._fill_order_array(order, quote)
         if order.status == 'unfilled':    
             # Only security with positive price will be deemed as tradable, nan and 0 will be ignored
             order.filled_quantity = order.quantity.mul((order.price > 0.).astype(float), fill_value=0.)
             # Adjust price to reflect sllipage as a percentage
-            order.filled_price = order.price.add(order.price.mul(np.sign(order.quantity).mul(TradingParam.sllipage), fill_value=0.), fill_value=0.) 
+            order.filled_price = order.price.add(order.price.mul(np.sign(order.quantity).mul(self.trading_param.sllipage), fill_value=0.), fill_value=0.) 
             # Check if there is a restriction in maximum trading percentage.
             # If yes, reduce the filled amount to threshold
             if 'amount' in quote:
                 # maximum amount as a percentage of market amount of the snapshot
-                max_tran_share = quote['amount'] * TradingParam.max_trading_percentage // order.filled_price ## maximum share to trade 
+                max_tran_share = quote['amount'] * self.trading_param.max_trading_percentage // order.filled_price ## maximum share to trade 
                 max_tran_share
                 # reduce those exceeding the max share 
                 order.filled_quantity = order.filled_quantity.where(np.abs(order.filled_quantity) < max_tran_share)\
@@ -63,7 +76,7 @@ class FillStrategy:
             order.abs_transaction_amount = np.abs(transaction_amt).sum()
             order.transaction_amount = transaction_amt.sum()
             # Calculate commision and tax of 0.1% (for sell only)
-            order.transaction_cost = order.abs_transaction_amount * TradingParam.commission - transaction_amt[transaction_amt < 0.].sum() * 0.001
+            order.transaction_cost = order.abs_transaction_amount * self.trading_param.commission - transaction_amt[transaction_amt < 0.].sum() * 0.001
 
             # Log faied order 
             cancelled_order = order.quantity.sub(order.filled_quantity, fill_value=0.)
@@ -75,7 +88,39 @@ class FillStrategy:
         else:
             raise Exception("Casn not pass in legit order to execute: {}".format(order.create_time.strftime("%Y-%m-%d")))
 
+    def _fill_order_array(self, order, quote):
+        """
+        fill_order for the array and sparse engines
 
+        order.quantity and the quote are vectors aligned on the sid id, hence
+        the fill is a single pass of kernels.fill_arrays without index alignment.
+        A SparseVector order only gathers the quote of the sid ids it holds.
+        Securities with nan or non-positive price are not traded.
 
-
-
+        Return
+        ------
+        cancelled_order: np.ndarray, SparseVector
+            orders failed, 0 for securities fully filled
+        """
+        quantity = order.quantity
+        price = order.price
+        amount = quote.get('amount')
+        sparse = isinstance(quantity, SparseVector)
+        if sparse:
+            ids, n, quantity = quantity.ids, quantity.n, quantity.values
+            price = price[ids]
+            amount = None if amount is None else amount[ids]
+
+        param = self.trading_param
+        filled_price, filled_quantity, order.abs_transaction_amount, order.transaction_amount, order.transaction_cost = \
+            fill_arrays(quantity, price, amount, param.sllipage, param.commission, param.max_trading_percentage,
+                        use_numba=self.use_numba)
+
+        order.status = 'filled'
+        if sparse:
+            order.filled_price = SparseVector(ids, filled_price, n)
+            order.filled_quantity = SparseVector(ids, filled_quantity, n).nonzero()
+            return SparseVector(ids, quantity - filled_quantity, n).nonzero()
+        order.filled_price = filled_price
+        order.filled_quantity = filled_quantity
+        return quantity - filled_quantity
@@ -0,0 +1,170 @@
+"""
+Fill and rebalance kernels on dense sid-indexed arrays
+
+Each kernel has a pure NumPy implementation and, when numba is installed, a
+JIT-compiled single-pass loop with the same semantics. The public functions
+dispatch to the compiled version unless use_numba=False
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # numba is optional
+    numba = None
+
+HAS_NUMBA = numba is not None
+
+
+def _fill_numpy(quantity, price, amount, sllipage, commission, max_trading_percentage, sell_tax):
+    tradable = price > 0.
+    # Adjust price to reflect sllipage as a percentage
+    filled_price = price * (1. + np.sign(quantity) * sllipage)
+    filled_quantity = np.where(tradable, quantity, 0.)
+    # Cap the filled share with the maximum trading percentage of market amount
+    if amount is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            max_tran_share = amount * max_trading_percentage // filled_price
+        filled_quantity = np.where(np.abs(filled_quantity) < max_tran_share, filled_quantity,
+                                   np.sign(filled_quantity) * max_tran_share)
+        filled_quantity = np.nan_to_num(filled_quantity, nan=0., posinf=0., neginf=0.)
+    transaction_amt = np.where(filled_quantity != 0., filled_price * filled_quantity, 0.)
+    abs_amount = np.abs(transaction_amt).sum()
+    # commision and tax (for sell only)
+    cost = abs_amount * commission - transaction_amt[transaction_amt < 0.].sum() * sell_tax
+    return filled_price, filled_quantity, abs_amount, transaction_amt.sum(), cost
+
+
+def _rebalance_numpy(target, pos, prc, total_value, corridor, by_weight):
+    target = np.nan_to_num(target)
+    if by_weight:
+        target = target * total_value
+    else:
+        target = target * prc
+    dif = target - prc * pos
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dif = np.where(np.abs(dif) > corridor, dif / prc, 0.)
+    return np.trunc(np.nan_to_num(dif, nan=0., posinf=0., neginf=0.))
+
+
+if HAS_NUMBA:
+    @numba.njit(cache=True)
+    def _fill_numba(quantity, price, amount, use_amount, sllipage, commission, max_trading_percentage, sell_tax):
+        n = len(quantity)
+        filled_price = np.empty(n)
+        filled_quantity = np.zeros(n)
+        abs_amount = 0.
+        net_amount = 0.
+        sell_amount = 0.
+        for i in range(n):
+            q = quantity[i]
+            p = price[i]
+            s = 1. if q > 0. else (-1. if q < 0. else (0. if q == 0. else q))
+            fp = p * (1. + s * sllipage)
+            filled_price[i] = fp
+            if not (p > 0.) or q == 0.:
+                continue
+            fq = q
+            if use_amount:
+                cap = amount[i] * max_trading_percentage // fp
+                if not (abs(fq) < cap):
+                    fq = s * cap
+                if not np.isfinite(fq):
+                    fq = 0.
+            if fq == 0.:
+                continue
+            filled_quantity[i] = fq
+            amt = fp * fq
+            abs_amount += abs(amt)
+            net_amount += amt
+            if amt < 0.:
+                sell_amount += amt
+        cost = abs_amount * commission - sell_amount * sell_tax
+        return filled_price, filled_quantity, abs_amount, net_amount, cost
+
+    @numba.njit(cache=True)
+    def _rebalance_numba(target, pos, prc, total_value, corridor, by_weight):
+        n = len(target)
+        res = np.zeros(n)
+        for i in range(n):
+            t = target[i]
+            if not np.isfinite(t):
+                t = 0.
+            p = prc[i]
+            t = t * total_value if by_weight else t * p
+            d = t - p * pos[i]
+            if not (abs(d) > corridor) or p == 0.:
+                continue
+            q = d / p
+            if np.isfinite(q):
+                res[i] = np.trunc(q)
+        return res
+
+
+def fill_arrays(quantity, price, amount, sllipage, commission, max_trading_percentage,
+                sell_tax=0.001, use_numba=True):
+    """
+    Fill orders on aligned arrays in one pass
+
+    Securities with nan or non-positive price are not traded, the filled share is
+    capped by amount * max_trading_percentage // filled_price when amount is given
+
+    Parameters
+    ----------
+    quantity, price: np.ndarray
+        order quantity and market price, aligned on the sid id
+    amount: np.ndarray or None
+        market amount of the snapshot
+    sllipage, commission, max_trading_percentage: float
+    sell_tax: float
+        tax rate of sells
+    use_numba: bool
+        use the compiled kernel when numba is installed
+
+    Returns
+    -------
+    filled_price, filled_quantity: np.ndarray
+    abs_transaction_amount, transaction_amount, transaction_cost: float
+    """
+    if use_numba and HAS_NUMBA:
+        quantity = np.ascontiguousarray(quantity, dtype=float)
+        price = np.ascontiguousarray(price, dtype=float)
+        use_amount = amount is not None
+        amount = np.ascontiguousarray(amount, dtype=float) if use_amount else np.empty(0)
+        return _fill_numba(quantity, price, amount, use_amount, float(sllipage), float(commission),
+                           float(max_trading_percentage), float(sell_tax))
+    return _fill_numpy(quantity, price, amount, sllipage, commission, max_trading_percentage, sell_tax)
+
+
+def rebalance_shares(target, pos, prc, total_value, corridor=0., by_weight=True, use_numba=True):
+    """
+    Shares to trade from the current position to the target in one pass
+
+    Differences of value not larger than corridor, or with nan / zero price, are
+    ignored, shares are truncated toward 0
+
+    Parameters
+    ----------
+    target: np.ndarray
+        target weight (by_weight) or target share, nan is treated as 0
+    pos: np.ndarray
+        current share
+    prc: np.ndarray
+        price used to value the portfolio
+    total_value: float
+        notional amount of the target portfolio
+    corridor: float
+        absolute corridor in value
+    by_weight: bool
+    use_numba: bool
+        use the compiled kernel when numba is installed
+
+    Returns
+    -------
+    np.ndarray
+    """
+    if use_numba and HAS_NUMBA:
+        return _rebalance_numba(np.ascontiguousarray(target, dtype=float), np.ascontiguousarray(pos, dtype=float),
+                                np.ascontiguousarray(prc, dtype=float), float(total_value), float(corridor),
+                                bool(by_weight))
+    return _rebalance_numpy(target, pos, prc, total_value, corridor, by_weight)
@@ -2,8 +2,11 @@
 Order Object
 """
 
+import numpy as np
 import pandas as pd
 
+from .sparse import SparseVector
+
 class Order:
     """
     Order Object that contains all trading information on a given snapshot 
@@ -12,8 +15,10 @@ class Order:
     ----------
     time: pd.Timestamp
         Time that the order created
-    quantity: pd.Series
-        Trading booked to execute
+    quantity: pd.Series, np.ndarray, SparseVector
+        Trading booked to execute. Under the array engine it is a dense vector
+        indexed by the integer sid id of the datasource, under the sparse engine
+        a SparseVector of the same sid ids
     price: pd.Series
         Settlement price
     filled_quantity: pd.Series
@@ -23,13 +28,14 @@ class Order:
     status: str
         Status of the order: unfilled, filled
     """
-    def __init__(self, quantity, create_time, price=pd.Series()):
-        assert isinstance(quantity, pd.Series) and isinstance(price, pd.Series), "Both price and order should be passed in terms of pd.Series" 
+    def __init__(self, quantity, create_time, price=pd.Series(dtype=float)):
+        assert isinstance(quantity, (pd.Series, np.ndarray, SparseVector)) and isinstance(price, (pd.Series, np.ndarray)), \
+            "Both price and order should be passed in terms of pd.Series or np.ndarray"
         self.price = price
         self.create_time = create_time
         self.quantity = quantity
-        self.filled_quantity = pd.Series()
-        self.filled_price = pd.Series()
+        self.filled_quantity = pd.Series(dtype=float)
+        self.filled_price = pd.Series(dtype=float)
         self.status = 'unfilled'
         self.transaction_amount = 0.                    # + means buy with cash, - means sell security
         self.abs_transaction_amount = 0.
@@ -8,7 +8,7 @@ import logging
 import numpy as np
 import pandas as pd
 
-from .context import Context
+from .sparse import SparseVector
 
 logger = logging.getLogger(__name__)
 
@@ -29,32 +29,83 @@ class Portfolio:
 
     init_cash: float
         初始资金
+    context: Context
+        所属策略的Context, 用于获取当前时间与行情
+    n_sids: int, optional
+        array引擎下证券总数, 此时pos为以sid id为下标的定长np.ndarray
+    sparse: bool
+        sparse引擎下pos为只保存持仓的SparseVector
+    incremental: bool
+        持仓与持仓证券的价格均未变化的bar不重新计算价值
         
     Attributes
     ---------
     cash: float
         扣除手续费和交易税后投资组合中剩余的自由现金
-    pos: pd.Series
+    pos: pd.Series, np.ndarray, SparseVector
         对应每只股票对应的股数
     market_value: float
         仓位绝对值加总
     """
-    def __init__(self, init_cash):
+    def __init__(self, init_cash, context, n_sids=None, sparse=False, incremental=False):
+        self.context = context
         self.cash = init_cash               # 初始资金
-        self.pos = pd.Series()              # 初始组合
+        if n_sids is None:
+            self.pos = pd.Series(dtype=float)          # 初始组合
+        elif sparse:
+            self.pos = SparseVector.empty(n_sids)   # 初始组合 (sparse引擎)
+        else:
+            self.pos = np.zeros(n_sids)     # 初始组合 (array引擎)
         self.realizable_value = 0.          # 证券变现值
         self.market_value = 0.              # 证券总市值
         self.cost_value = 0.                # 投资组合总成本价格
 
+        self.incremental = incremental
+        # 持仓证券在行情中的下标与对应的股数, 持仓改变时重新计算
+        self._held = None
+        self._held_qty = None
+        self._held_on = None                # pandas引擎下计算下标所用的行情index
+        # 上次估值所用的持仓证券价格 (incremental)
+        self._held_prc = None
+
     def update_by_price(self, benchmark='close'):
         """
         根据行情更新仓位，现金没有变化
             1. 调整market_value
             2. 调整realizable_value
+
+        只计算持仓证券的价值: 持仓改变时计算一次持仓证券在行情中的下标, 之后每个bar按下标取出
+        持仓证券的价格. dense数据源 (array, sparse引擎) 的计算量与持仓个数而不是证券总数成正比;
+        pandas引擎每个bar的行情是新的index, 需要与上次计算下标所用的index逐元素比较, 相同时沿用下标,
+        仍与证券总数成正比 (取出每个bar的行情本身已是如此), 但省去了重新计算下标
         """
-        pos_value = self.pos.mul(Context.cur_quote[benchmark], fill_value=0.)
-        self.market_value = np.abs(pos_value).sum()
-        self.realizable_value = pos_value.sum()
+        prc = self.context.cur_quote[benchmark]
+        if isinstance(self.pos, SparseVector):
+            qty = self.pos.values
+            held_prc = prc[self.pos.ids]
+        elif isinstance(self.pos, np.ndarray):
+            if self._held is None:
+                self._held = np.flatnonzero(self.pos)
+                self._held_qty = self.pos[self._held]
+            qty = self._held_qty
+            held_prc = prc[self._held]
+        else:
+            # 非dense数据源每日行情的sid可能不同 (如停牌), 行情index改变时重新计算下标
+            if self._held is None or not (self._held_on is prc.index or self._held_on.equals(prc.index)):
+                self._held = prc.index.get_indexer(self.pos.index)
+                self._held_on = prc.index
+                # 行情中没有的证券价值为0
+                self._held_qty = np.where(self._held >= 0, self.pos.to_numpy(dtype=float), 0.)
+            qty = self._held_qty
+            held_prc = prc.to_numpy()[self._held]
+
+        if self.incremental:
+            if self._held_prc is not None and np.array_equal(held_prc, self._held_prc, equal_nan=True):
+                return
+            self._held_prc = held_prc
+        pos_value = qty * held_prc
+        self.market_value = np.nansum(np.abs(pos_value))
+        self.realizable_value = np.nansum(pos_value)
 
     def update_by_order(self, order):
         """
@@ -64,13 +115,19 @@ class Portfolio:
             3. 调整现金仓位 (cash)
         """
         if order.status == 'filled':
-            self.pos = self.pos.add(order.filled_quantity, fill_value=0.)
+            if isinstance(self.pos, SparseVector):
+                self.pos = self.pos.add(order.filled_quantity)
+            elif isinstance(self.pos, np.ndarray):
+                self.pos = self.pos + order.filled_quantity
+            else:
+                self.pos = self.pos.add(order.filled_quantity, fill_value=0.)
+            self._held = self._held_prc = None
             self.cost_value = self.cost_value + order.transaction_amount
             self.cash = self.cash - order.transaction_amount - order.transaction_cost
         else:
-            logger.error("【{}】订单未正确处理".format(Context.cur_time))
+            logger.error("【{}】订单未正确处理".format(self.context.cur_time))
         if self.cash < 0:
-            logger.info("【{}】现金余额不足：【{}】\n ".format(Context.cur_time, self.cash))
+            logger.info("【{}】现金余额不足：【{}】\n ".format(self.context.cur_time, self.cash))
             # raise Exception("现金不足")
 
 
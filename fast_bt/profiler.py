@@ -0,0 +1,101 @@
+"""
+回测分阶段计时
+"""
+
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+
+class StageProfiler:
+    """
+    按阶段记录回测的wall time与调用次数
+
+    通过FastStrategy.enable_profiling()挂载到策略与broker上, 未挂载时回测中每个阶段
+    只多一次 is None 判断. 自定义的profiler只需实现相同的
+    start_bar(time), call(stage, func, *args), add(stage, elapsed), end_bar() 接口
+
+    记录的阶段 (嵌套的阶段同时计入外层阶段):
+        quote: 当日行情切片
+        on_quote: Broker.on_quote, 包括
+            fill_order: FillStrategy.fill_order
+            update_by_order: Portfolio.update_by_order
+            update_by_price: Portfolio.update_by_price
+        on_data: 策略逻辑 (_on_data, 包括rebalance下单)
+        post_day: Broker.post_day
+        bar: 每个bar的总时间
+        run: FastStrategy.run的总时间
+
+    Attributes
+    ----------
+    total: dict
+        stage -> 累计时间 (秒)
+    calls: dict
+        stage -> 调用次数
+    """
+    def __init__(self):
+        self.total = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._dates = []
+        self._bars = []
+        self._cur = None
+        self._bar_start = None
+
+    def start_bar(self, time_):
+        """开始记录一个bar"""
+        self._dates.append(time_)
+        self._cur = {}
+        self._bar_start = time.perf_counter()
+
+    def end_bar(self):
+        """结束当前bar"""
+        self.add('bar', time.perf_counter() - self._bar_start)
+        self._bars.append(self._cur)
+        self._cur = None
+
+    def add(self, stage, elapsed):
+        """累加一个阶段的时间, 在bar内时同时计入当前bar"""
+        self.total[stage] += elapsed
+        self.calls[stage] += 1
+        if self._cur is not None:
+            self._cur[stage] = self._cur.get(stage, 0.) + elapsed
+
+    def call(self, stage, func, *args):
+        """调用func并计入stage"""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def reset(self):
+        self.__init__()
+
+    def to_frame(self):
+        """
+        每个bar各阶段的时间
+
+        Returns
+        -------
+        pd.DataFrame
+            date * stage, 当日未调用的阶段为0
+        """
+        res = pd.DataFrame(self._bars, index=pd.DatetimeIndex(self._dates[:len(self._bars)], name='date'))
+        return res.fillna(0.)
+
+    def summary(self):
+        """
+        各阶段的累计时间、调用次数、平均时间与占bar总时间的比例
+
+        Returns
+        -------
+        pd.DataFrame
+            index stage, columns total_sec, calls, mean_sec, pct_of_bar
+        """
+        res = pd.DataFrame({'total_sec': pd.Series(self.total, dtype=float),
+                            'calls': pd.Series(self.calls, dtype=int)})
+        res.index.name = 'stage'
+        res['mean_sec'] = res['total_sec'] / res['calls']
+        res['pct_of_bar'] = res['total_sec'] / self.total['bar'] if self.total.get('bar') else float('nan')
+        return res.sort_values('total_sec', ascending=False)
@@ -0,0 +1,255 @@
+"""
+回测历史记录
+"""
+
+import numpy as np
+import pandas as pd
+
+from .sparse import SparseVector
+
+
+class HistoryRecorder:
+    """
+    列式的历史记录器 (array引擎)
+
+    在回测开始前按 date * sid 预先分配仓位、成交订单、未成交订单的数组，
+    以及各标量 (现金、市值等) 的定长时间序列. 每个bar只写入对应行，
+    history_* 方法直接返回已写入部分的视图, 无需从dict重建DataFrame
+
+    Parameters
+    ----------
+    dates: pd.DatetimeIndex
+        回测的所有交易日
+    sids: pd.Index
+        数据源的证券代码, 数组的第二维即为sid id
+
+    Attributes
+    ----------
+    n: int
+        已经记录的bar数
+    pos, filled_order, unfilled_order: np.ndarray
+        date * sid
+    has_filled, has_unfilled: np.ndarray
+        当日是否有成交 / 未成交订单
+    cash, realizable_value, cost_value, market_value, transaction_cost, turnover, holding_num: np.ndarray
+        date
+    """
+    sparse = False
+
+    def __init__(self, dates, sids):
+        self.dates = dates
+        self.sids = sids
+        self.n = 0
+        shape = (len(dates), len(sids))
+        # 持仓
+        self.pos = np.zeros(shape)
+        # 成交订单
+        self.filled_order = np.zeros(shape)
+        # 未成交订单
+        self.unfilled_order = np.zeros(shape)
+        self._init_series()
+
+    def _init_series(self):
+        """分配标量时间序列"""
+        dates = self.dates
+        self.has_filled = np.zeros(len(dates), dtype=bool)
+        self.has_unfilled = np.zeros(len(dates), dtype=bool)
+        # 标量时间序列
+        self.cash = np.zeros(len(dates))
+        self.realizable_value = np.zeros(len(dates))
+        self.cost_value = np.zeros(len(dates))
+        self.market_value = np.zeros(len(dates))
+        self.transaction_cost = np.zeros(len(dates))
+        self.turnover = np.zeros(len(dates))
+        self.holding_num = np.zeros(len(dates), dtype=int)
+
+    @property
+    def n_sids(self):
+        return len(self.sids)
+
+    def record(self, portfolio, filled_orders, cancelled_orders):
+        """
+        记录当日的组合信息, 写入第self.n行
+
+        Parameters
+        ----------
+        portfolio: Portfolio
+            收盘后的投资组合
+        filled_orders: list of Order
+            当日撮合的订单
+        cancelled_orders: list of np.ndarray
+            当日订单中未成交的部分
+        """
+        i = self.n
+        self._record_quantity(i, portfolio, filled_orders, cancelled_orders)
+        for order in filled_orders:
+            self.transaction_cost[i] += order.transaction_cost
+            self.turnover[i] += order.abs_transaction_amount
+        self.has_filled[i] = bool(filled_orders)
+        self.has_unfilled[i] = bool(cancelled_orders)
+
+        self.cash[i] = portfolio.cash
+        self.realizable_value[i] = portfolio.realizable_value
+        self.cost_value[i] = portfolio.cost_value
+        self.market_value[i] = portfolio.market_value
+        self.n = i + 1
+
+    def _record_quantity(self, i, portfolio, filled_orders, cancelled_orders):
+        """记录第i行的持仓, 成交与未成交股数"""
+        self.pos[i] = portfolio.pos
+        self.holding_num[i] = np.count_nonzero(self.pos[i])
+        for order in filled_orders:
+            self.filled_order[i] += order.filled_quantity
+        for cancelled in cancelled_orders:
+            self.unfilled_order[i] += cancelled
+
+    def loc(self, date):
+        """返回交易日对应的行号, 若尚未记录则返回None"""
+        i = self.dates.get_indexer([pd.Timestamp(date)])[0]
+        if 0 <= i < self.n:
+            return i
+        return None
+
+    def series(self, name, mask=None):
+        """
+        标量记录的时间序列 (视图)
+
+        Parameters
+        ----------
+        name: str
+            cash, realizable_value, cost_value, market_value, transaction_cost, turnover, holding_num
+        mask: str, optional
+            has_filled, has_unfilled, 只返回对应为True的交易日
+        """
+        values = getattr(self, name)[:self.n]
+        dates = self.dates[:self.n]
+        if mask is not None:
+            mask = getattr(self, mask)[:self.n]
+            return pd.Series(values[mask], index=dates[mask])
+        return pd.Series(values, index=dates, copy=False)
+
+    def row(self, name, i):
+        """date * sid 记录的某一行 (视图)"""
+        return pd.Series(getattr(self, name)[i], index=self.sids, copy=False)
+
+    def frame(self, name, mask=None):
+        """
+        date * sid 记录 (视图)
+
+        Parameters
+        ----------
+        name: str
+            pos, filled_order, unfilled_order
+        mask: str, optional
+            has_filled, has_unfilled, 只返回对应为True的交易日
+        """
+        values = getattr(self, name)[:self.n]
+        dates = self.dates[:self.n]
+        if mask is not None:
+            mask = getattr(self, mask)[:self.n]
+            values, dates = values[mask], dates[mask]
+        return pd.DataFrame(values, index=dates, columns=self.sids, copy=False)
+
+
+class _CSRBuffer:
+    """
+    按行追加写入的CSR缓冲
+
+    indptr按交易日预先分配, indices与data按需倍增, 占用内存与非0元素个数成正比
+    """
+    def __init__(self, n_rows, capacity=1024):
+        self.indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        self.indices = np.empty(capacity, dtype=np.int64)
+        self.data = np.empty(capacity)
+
+    def append(self, i, ids, values):
+        """写入第i行, 行需要按顺序写入"""
+        start = self.indptr[i]
+        end = start + len(ids)
+        if end > len(self.indices):
+            capacity = max(end, 2 * len(self.indices))
+            self.indices = np.resize(self.indices, capacity)
+            self.data = np.resize(self.data, capacity)
+        self.indices[start:end] = ids
+        self.data[start:end] = values
+        self.indptr[i + 1] = end
+
+    def row(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def to_dense(self, n, mask=None):
+        """
+        前n行转换为稠密数组, 只包括曾经出现过的列
+
+        Returns
+        -------
+        cols: np.ndarray
+            出现过的sid id
+        arr: np.ndarray
+            rows * cols
+        """
+        nnz = self.indptr[n]
+        entry_row = np.repeat(np.arange(n), np.diff(self.indptr[:n + 1]))
+        indices, data = self.indices[:nnz], self.data[:nnz]
+        if mask is not None:
+            keep = mask[entry_row]
+            entry_row = (np.cumsum(mask) - 1)[entry_row[keep]]
+            indices, data = indices[keep], data[keep]
+            n = int(mask.sum())
+        cols, inv = np.unique(indices, return_inverse=True)
+        arr = np.zeros((n, len(cols)))
+        arr[entry_row, inv] = data
+        return cols, arr
+
+
+class SparseHistoryRecorder(HistoryRecorder):
+    """
+    稀疏的历史记录器 (sparse引擎)
+
+    持仓、成交订单、未成交订单以CSR的形式按交易日记录, 内存与持仓个数而不是证券总数成正比.
+    标量时间序列与HistoryRecorder相同
+    """
+    sparse = True
+
+    def __init__(self, dates, sids):
+        self.dates = dates
+        self.sids = sids
+        self.n = 0
+        self.pos = _CSRBuffer(len(dates))
+        self.filled_order = _CSRBuffer(len(dates))
+        self.unfilled_order = _CSRBuffer(len(dates))
+        self._init_series()
+
+    def _record_quantity(self, i, portfolio, filled_orders, cancelled_orders):
+        """记录第i行的持仓, 成交与未成交股数"""
+        n = self.n_sids
+        self.pos.append(i, portfolio.pos.ids, portfolio.pos.values)
+        self.holding_num[i] = len(portfolio.pos)
+        filled = SparseVector.sum([order.filled_quantity for order in filled_orders], n)
+        self.filled_order.append(i, filled.ids, filled.values)
+        cancelled = SparseVector.sum(cancelled_orders, n)
+        self.unfilled_order.append(i, cancelled.ids, cancelled.values)
+
+    def row(self, name, i):
+        """某一行记录, 只包括非0的sid"""
+        ids, values = getattr(self, name).row(i)
+        return pd.Series(values, index=self.sids[ids])
+
+    def frame(self, name, mask=None):
+        """
+        date * sid 记录, 只包括曾经非0的sid
+
+        Parameters
+        ----------
+        name: str
+            pos, filled_order, unfilled_order
+        mask: str, optional
+            has_filled, has_unfilled, 只返回对应为True的交易日
+        """
+        dates = self.dates[:self.n]
+        if mask is not None:
+            mask = getattr(self, mask)[:self.n]
+            dates = dates[mask]
+        cols, values = getattr(self, name).to_dense(self.n, mask)
+        return pd.DataFrame(values, index=dates, columns=self.sids[cols])
@@ -0,0 +1,81 @@
+"""
+Sparse vector indexed by sid id
+"""
+
+import numpy as np
+
+
+class SparseVector:
+    """
+    Sparse holdings / order representation used by the sparse engine
+
+    Only non-zero entries are stored as a sorted array of sid ids plus the
+    corresponding values, so the cost of every operation scales with the number
+    of holdings instead of the universe size
+
+    Attributes
+    ----------
+    ids: np.ndarray
+        sorted sid ids (position in datasource.sids)
+    values: np.ndarray
+        values of the corresponding sid ids
+    n: int
+        universe size
+    """
+    def __init__(self, ids, values, n):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.values = np.asarray(values, dtype=float)
+        self.n = n
+
+    @classmethod
+    def empty(cls, n):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0), n)
+
+    @classmethod
+    def from_dense(cls, arr):
+        """build from a dense vector, nan is treated as 0"""
+        arr = np.nan_to_num(np.asarray(arr, dtype=float))
+        ids = np.flatnonzero(arr)
+        return cls(ids, arr[ids], len(arr))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_dense(self):
+        res = np.zeros(self.n)
+        res[self.ids] = self.values
+        return res
+
+    def take(self, ids):
+        """values at the given sorted sid ids, 0 for those not stored"""
+        if len(self.ids) == 0:
+            return np.zeros(len(ids))
+        loc = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return np.where(self.ids[loc] == ids, self.values[loc], 0.)
+
+    def nonzero(self):
+        """drop zero entries"""
+        mask = self.values != 0.
+        if mask.all():
+            return self
+        return SparseVector(self.ids[mask], self.values[mask], self.n)
+
+    def add(self, other):
+        """element-wise sum with another SparseVector, zero entries are dropped"""
+        if len(other) == 0:
+            return self
+        if len(self) == 0:
+            return other.nonzero()
+        ids = np.union1d(self.ids, other.ids)
+        values = np.zeros(len(ids))
+        values[np.searchsorted(ids, self.ids)] += self.values
+        values[np.searchsorted(ids, other.ids)] += other.values
+        return SparseVector(ids, values, self.n).nonzero()
+
+    @staticmethod
+    def sum(vectors, n):
+        """sum of a list of SparseVector"""
+        res = SparseVector.empty(n)
+        for v in vectors:
+            res = res.add(v)
+        return res
@@ -7,6 +7,7 @@ import abc
 import sys 
 import logging
 from copy import deepcopy
+from time import perf_counter
 
 import numpy as np
 import pandas as pd
@@ -16,6 +17,11 @@ from .broker import Broker
 from .context import Context, TradingParam
 from .fill import FillStrategy
 from .order import Order
+from .recorder import HistoryRecorder, SparseHistoryRecorder
+from .sparse import SparseVector
+from .vectorized import VectorizedHoldingStrategy
+from .kernels import rebalance_shares
+from .profiler import StageProfiler
 from tqdm import tqdm
 
 
@@ -36,20 +42,44 @@ class StrategyEnvironment:
         next_bar, this_bar
     fill_method: str , default vwap
         用于撮合成交的价格
+    engine: str, default pandas
+        pandas: 以pd.Series按sid对齐进行计算
+        array: 仓位、订单、行情均为以sid id为下标的定长np.ndarray, 需要dense的数据源
+        sparse: 同array, 但仓位与订单只保存非0部分(SparseVector), 历史记录为CSR格式,
+                适用于证券总数远大于持仓个数的情况
+        vectorized: 只用于非路径依赖的目标权重组合 (VectorizedHoldingStrategy), 不考虑现金约束, 成交额上限的剩余部分撤销
+    use_numba: bool, default True
+        array, sparse, vectorized引擎在安装了numba时使用编译后的撮合与调仓kernel
+    incremental_valuation: bool, default False
+        持仓与持仓证券的价格均未变化的bar不重新计算组合价值, 见Portfolio.update_by_price
+    max_trading_percentage: float, optional
+        每个bar每只证券的成交额不超过当bar成交额的比例 (participation), 默认TradingParam.max_trading_percentage
+    carry_over: bool, default False
+        因成交额上限未成交的部分留到之后的bar继续撮合, 而不是撤销, 见Broker. vectorized引擎只在调仓日撮合, 不支持
+    decay: float, default 1.
+        carry_over时每个bar保留的未成交比例, 1为一直保留直至成交或调仓, 0等同于撤销
     """
     def __init__(self, init_cash=10000000.0, fill_time='next_bar',
                  fill_method='vwap', commission=None,
-                 sllipage=None):
+                 sllipage=None, engine='pandas', use_numba=True, incremental_valuation=False,
+                 max_trading_percentage=None, carry_over=False, decay=1.):
         if fill_time == 'this_bar' and fill_method == 'open':
             logger.warning("以当前开盘价很可能使用到了未来信息")
+        assert engine in ('pandas', 'array', 'sparse', 'vectorized'), "engine只支持pandas, array, sparse, vectorized"
+        assert not (carry_over and engine == 'vectorized'), "vectorized引擎只在调仓日撮合, 不支持carry_over"
+        assert 0. <= decay <= 1., "decay应在0与1之间"
         self.fill_time = fill_time
-        self.fill_strategy = FillStrategy(fill_method=fill_method)
-
-        # 交易撮合成本
-        if commission is not None:
-            TradingParam.commission = commission
-        if sllipage is not None:
-            TradingParam.sllipage = sllipage
+        self.engine = engine
+        self.use_numba = use_numba
+        self.incremental_valuation = incremental_valuation
+        self.carry_over = carry_over
+        self.decay = decay
+
+        # 交易撮合成本, 只对使用该环境的策略生效
+        self.trading_param = TradingParam(sllipage=sllipage, commission=commission,
+                                          max_trading_percentage=max_trading_percentage)
+        self.fill_strategy = FillStrategy(fill_method=fill_method, trading_param=self.trading_param,
+                                          use_numba=use_numba)
 
         # 初始资金
         self.init_cash = init_cash
@@ -72,8 +102,9 @@ class FastStrategy(metaclass=abc.ABCMeta):
     """
 
     def __init__(self, datasource, env, name, log_file=None):
-        # 数据源
-        self._datasource = deepcopy(datasource)
+        assert env.engine != 'vectorized', "vectorized引擎只用于VectorizedHoldingStrategy"
+        # 数据源, 只读, 多个策略共享同一个数据源
+        self._datasource = datasource
 
         # 策略运行环境
         self._env = env
@@ -81,12 +112,26 @@ class FastStrategy(metaclass=abc.ABCMeta):
         # 策略名称
         self._name = name
 
-        # broker
-        self._broker = Broker(env.init_cash, env.fill_strategy)
+        # 当前时间与行情, 由策略持有并传给broker与portfolio
+        self.context = Context()
+
+        # broker, array引擎下所有向量在载入时一次性对齐到数据源的sid
+        if env.engine in ('array', 'sparse'):
+            assert self._datasource.dense, "{}引擎需要dense的数据源".format(env.engine)
+            recorder_cls = SparseHistoryRecorder if env.engine == 'sparse' else HistoryRecorder
+            recorder = recorder_cls(self._datasource.dates, self._datasource.sids)
+        else:
+            recorder = None
+        self._broker = Broker(env.init_cash, env.fill_strategy, self.context, recorder,
+                              incremental_valuation=env.incremental_valuation,
+                              carry_over=env.carry_over, decay=env.decay)
 
         # 交易日列表
         # self._dates = pd.to_datetime(dates.get_trade_date(start_date, end_date)).tolist()
-        self._dates = sorted(self._datasource.data.index.get_level_values('date').unique())
+        if self._datasource.dense:
+            self._dates = self._datasource.dates.tolist()
+        else:
+            self._dates = sorted(self._datasource.data.index.get_level_values('date').unique())
 
         # # 证券代码
         # self._sids = self._datasource.data['close'].columns.tolist()
@@ -94,6 +139,9 @@ class FastStrategy(metaclass=abc.ABCMeta):
         # 组合信息
         self._portfolio_info = None
 
+        # 分阶段计时, 见enable_profiling
+        self.profiler = None
+
         # 设置日志
         self.__init_logging(log_file)
 
@@ -106,17 +154,22 @@ class FastStrategy(metaclass=abc.ABCMeta):
         log_file: str, optional
             给定日志文件路径
         """
-        # 初始化日志
+        # 初始化日志, 所有策略共用模块级的logger, handler只添加一次
+        # (handler不引用策略, 否则回测结束后策略与其broker、历史记录无法释放)
         root_logger = logging.getLogger("fast_backtest")
         root_logger.setLevel(logging.DEBUG)
 
-        sh = logging.StreamHandler(self)
-        sh.setLevel(logging.WARNING)
-
-        root_logger.addHandler(sh)
+        if not any(getattr(h, '_fast_bt_stream', False) for h in root_logger.handlers):
+            sh = logging.StreamHandler()
+            sh.setLevel(logging.WARNING)
+            sh._fast_bt_stream = True
+            root_logger.addHandler(sh)
         # 添加日志文件
         if log_file:
-            fh = logging.FileHandler('{}.log'.format(os.path.join(log_file, self.name)), 'w', 'utf-8')
+            path = os.path.abspath('{}.log'.format(os.path.join(log_file, self._name)))
+            if any(getattr(h, 'baseFilename', None) == path for h in root_logger.handlers):
+                return
+            fh = logging.FileHandler(path, 'w', 'utf-8')
             fh.setLevel(logging.INFO)
 
             formatter = logging.Formatter(
@@ -137,34 +190,41 @@ class FastStrategy(metaclass=abc.ABCMeta):
             当前时刻的行情
         """
         # 当前时间
-        Context.cur_time = time
+        self.context.cur_time = time
         # 当前行情
-        Context.cur_quote = quote
+        self.context.cur_quote = quote
         if self._env.fill_time == 'next_bar':
             # 响应最新行情，撮合上一时刻发出的订单，更新组合价格
             # 资金不足则停止模拟
-            self._broker.on_quote()
+            self.__stage('on_quote', self._broker.on_quote)
             # 策略发出信号
-            self._on_data()
+            self.__stage('on_data', self._on_data)
 
         elif self._env.fill_time == 'this_bar':
             # 策略发出信号
-            self._on_data()
+            self.__stage('on_data', self._on_data)
             # 响应订单，撮合
-            self._broker.on_quote()
+            self.__stage('on_quote', self._broker.on_quote)
 
         #  收盘操作
         # 记录各类组合信息
-        self._broker.post_day()
-        Context.pre_time = time
-        Context.pre_quote = quote
+        self.__stage('post_day', self._broker.post_day)
+        self.context.pre_time = time
+        self.context.pre_quote = quote
+
+    def __stage(self, name, func):
+        """运行回测的一个阶段, 开启分阶段计时时计入profiler"""
+        if self.profiler is None:
+            func()
+        else:
+            self.profiler.call(name, func)
 
     def _place_order(self, order):
         """
-        向broker发送订单, 输入如果是pd.Series则穿件为订单类
+        向broker发送订单, 输入如果是pd.Series, np.ndarray或SparseVector则穿件为订单类
         """
-        if isinstance(order, pd.Series):
-            order = Order(order, Context.cur_time)
+        if isinstance(order, (pd.Series, np.ndarray, SparseVector)):
+            order = Order(order, self.context.cur_time)
         self._broker.place_order(order)
 
     @abc.abstractmethod
@@ -176,22 +236,71 @@ class FastStrategy(metaclass=abc.ABCMeta):
 
         """
 
-    def run(self):
-        """回放行情进行回测"""
-        
-        quotes = {}
+    def run(self, progress=True):
+        """
+        回放行情进行回测
+
+        Parameters
+        ----------
+        progress: bool
+            是否显示进度条
+        """
+        prof = self.profiler
+        # 数据源只读, 被修改时报错
+        self._datasource.check_unchanged()
         # 生成当日quotes
         n = len(self._dates)
 
-        with tqdm(total=n, file=sys.stdout, ascii=True, desc="[Fast Backtest] {} In Progress".format(self._name)) as progress:
-            for time in self._dates:
-                temp = self._datasource.data.loc[time]
-                for k in self._datasource.data:
-                    quotes.update({k: temp.loc[:, k]})
-                self.__on_quote(time, quotes)
-                # 下一日开始前重置
-                progress.update(1)
-                quotes = {}
+        with tqdm(total=n, file=sys.stdout, ascii=True, desc="[Fast Backtest] {} In Progress".format(self._name),
+                  disable=not progress) as bar:
+            run_start = perf_counter() if prof is not None else None
+            for i, time in enumerate(self._dates):
+                if prof is None:
+                    quotes = self.__quote(i, time)
+                    self.__on_quote(time, quotes)
+                else:
+                    prof.start_bar(time)
+                    quotes = prof.call('quote', self.__quote, i, time)
+                    self.__on_quote(time, quotes)
+                    prof.end_bar()
+                bar.update(1)
+            if prof is not None:
+                prof.add('run', perf_counter() - run_start)
+        self._datasource.check_unchanged()
+
+    def __quote(self, i, time):
+        """第i个交易日的行情"""
+        if self._datasource.dense:
+            # 稠密面板: 直接取当日行视图, 无需切片
+            return self._datasource.quote_at(i, raw=self._env.engine != 'pandas')
+        quotes = {}
+        temp = self._datasource.data.loc[time]
+        for k in self._datasource.data:
+            quotes.update({k: temp.loc[:, k]})
+        return quotes
+
+    def enable_profiling(self, profiler=None):
+        """
+        开启分阶段计时, 在run之前调用
+
+        Parameters
+        ----------
+        profiler: StageProfiler, optional
+            或实现了相同接口的对象, 默认新建StageProfiler
+
+        Returns
+        -------
+        StageProfiler
+            run之后通过profiler.to_frame(), profiler.summary()获取结果
+        """
+        self.profiler = StageProfiler() if profiler is None else profiler
+        self._broker.profiler = self.profiler
+        return self.profiler
+
+    def disable_profiling(self):
+        """关闭分阶段计时"""
+        self.profiler = None
+        self._broker.profiler = None
     # def run(self):
     #     """回放行情进行回测"""
         
@@ -213,8 +322,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
 
         Parameters
         ----------
-        target_portfolio: pd.Series
-            权重或者股数
+        target_portfolio: pd.Series, np.ndarray, SparseVector
+            权重或者股数, array / sparse引擎下也可直接传入按sid id对齐的np.ndarray或SparseVector
         notional_amount: float
             下期投资组合总权重
         corridor: float
@@ -226,6 +335,10 @@ class FastStrategy(metaclass=abc.ABCMeta):
         # 撤销未成交订单
         self._broker.cancel_order()
 
+        if self._env.engine != 'pandas':
+            self._rebalance_array(target_portfolio, notional_amount, corridor, by_weight, bench_price)
+            return
+
         # 计算目标组合仓位金额总额, 若notional amount没有提供，择是当前仓位总额(包括现金)
         if notional_amount:
             total_value = notional_amount
@@ -235,9 +348,9 @@ class FastStrategy(metaclass=abc.ABCMeta):
         if by_weight:
             target_portfolio = target_portfolio.mul(total_value)         
         else:
-            target_portfolio = target_portfolio.mul(Context.cur_quote[bench_price], fill_value=0.)
+            target_portfolio = target_portfolio.mul(self.context.cur_quote[bench_price], fill_value=0.)
         # 计算调仓金额
-        cur_portfolio = Context.cur_quote[bench_price].mul(self._broker.portfolio.pos, fill_value=0.)
+        cur_portfolio = self.context.cur_quote[bench_price].mul(self._broker.portfolio.pos, fill_value=0.)
         dif_portfolio = target_portfolio.sub(cur_portfolio, fill_value=0.)
 
         # 当调仓金额小于一定值时，则忽略该调仓, 当小于1时当做百分比
@@ -248,11 +361,61 @@ class FastStrategy(metaclass=abc.ABCMeta):
 
         # dif_portfolio = np.round(dif_portfolio.div(Context.cur_quote[bench_price], fill_value=0.))\
         #                                       .replace([np.inf, -np.inf], np.nan)
-        dif_portfolio = dif_portfolio.div(Context.cur_quote[bench_price], fill_value=0.).replace([np.inf, -np.inf], np.nan).fillna(0.).astype(int)
+        dif_portfolio = dif_portfolio.div(self.context.cur_quote[bench_price], fill_value=0.).replace([np.inf, -np.inf], np.nan).fillna(0.).astype(int)
         # 此处的订单只包括非0的element
         dif_portfolio = dif_portfolio[dif_portfolio.abs() > 0.]
         self._place_order(dif_portfolio)
 
+    def _rebalance_array(self, target_portfolio, notional_amount, corridor, by_weight, bench_price):
+        """
+        array / sparse引擎下的rebalance, 所有计算均在以sid id为下标的向量上进行
+
+        sparse引擎下只在目标持仓与当前持仓的sid id上计算, 下单为SparseVector
+        """
+        pos = self._broker.portfolio.pos
+        sparse = isinstance(pos, SparseVector)
+        if isinstance(target_portfolio, pd.Series):
+            target_portfolio = target_portfolio.reindex(self._datasource.sids).to_numpy(dtype=float)
+        if sparse:
+            if not isinstance(target_portfolio, SparseVector):
+                target_portfolio = SparseVector.from_dense(target_portfolio)
+            ids = np.union1d(target_portfolio.ids, pos.ids)
+            target_portfolio = target_portfolio.take(ids)
+            cur_pos = pos.take(ids)
+            prc = self.context.cur_quote[bench_price][ids]
+        else:
+            cur_pos = pos
+            prc = self.context.cur_quote[bench_price]
+
+        if notional_amount:
+            total_value = notional_amount
+        else:
+            total_value = self._broker.portfolio.realizable_value + self._broker.portfolio.cash
+        if 1. > corridor > 0.:
+            corridor *= total_value
+        # 调仓股数, 价格缺失的证券不进行调仓
+        dif_portfolio = rebalance_shares(target_portfolio, cur_pos, prc, total_value, corridor, by_weight,
+                                         use_numba=self._env.use_numba)
+        if sparse:
+            dif_portfolio = SparseVector(ids, dif_portfolio, pos.n).nonzero()
+        self._place_order(dif_portfolio)
+
+    def _recorded_quantity(self, name, date=None, mask=None):
+        """
+        array引擎下从HistoryRecorder获取 date * sid 的记录
+
+        给定日期时返回当日非0的部分(无记录时返回None), 否则返回只包括曾经非0的sid的DataFrame
+        """
+        recorder = self._broker.recorder
+        if date is not None:
+            i = recorder.loc(date)
+            if i is None or (mask is not None and not getattr(recorder, mask)[i]):
+                return None
+            temp = recorder.row(name, i)
+            return temp[temp.abs() > 0.]
+        temp = recorder.frame(name, mask)
+        return temp.loc[:, (temp != 0.).any(axis=0).to_numpy()]
+
     # ------------------- 用户获取信息的方法 ---------------------
 
     def history_placed_order(self, date):
@@ -268,7 +431,7 @@ class FastStrategy(metaclass=abc.ABCMeta):
         -------
         list of order
         """
-        temp = [x for x in self._broker.place_order if x.create_time == pd.Timestamp(date)]
+        temp = [x for x in self._broker.placed_order if x.create_time == pd.Timestamp(date)]
         temp = deepcopy(temp)
         return temp
 
@@ -288,7 +451,9 @@ class FastStrategy(metaclass=abc.ABCMeta):
             index * sids
             sids中只包括曾经有过持仓的
         """
-        if date is not None:
+        if self._broker.recorder is not None:
+            temp = self._recorded_quantity('pos', date)
+        elif date is not None:
             temp = self._broker.pos[pd.Timestamp(date)]
             temp = temp[temp.abs() > 0.]
         else:
@@ -312,13 +477,20 @@ class FastStrategy(metaclass=abc.ABCMeta):
         pd.DataFrame
             index * sid
         """
+        if self._datasource.dense:
+            prc = pd.DataFrame(self._datasource.panel['close'], index=self._datasource.dates,
+                               columns=self._datasource.sids, copy=False)
         if date is not None:
-            prc = self._datasource.data.loc[pd.Timestamp('2010-01-08'), 'close']
+            if self._datasource.dense:
+                prc = prc.loc[pd.Timestamp(date)]
+            else:
+                prc = self._datasource.data.loc[pd.Timestamp(date), 'close']
             pos = self.history_pos(date=date)
             wgt = pos * prc 
-            wgt = wgt / (wgt.sum() + self._broker.cash)
+            wgt = wgt / (wgt.sum() + self.history_cash[pd.Timestamp(date)])
         else:
-            prc = self._datasource.data['close'].unstack()
+            if not self._datasource.dense:
+                prc = self._datasource.data['close'].unstack()
             pos = self.history_pos()
             wgt = prc * pos 
             wgt = wgt.div(wgt.sum(axis=1) + self.history_cash, axis=0)
@@ -340,7 +512,9 @@ class FastStrategy(metaclass=abc.ABCMeta):
             index * sids
             sids中只包括曾经有过订单的
         """
-        if date is not None:
+        if self._broker.recorder is not None:
+            temp = self._recorded_quantity('filled_order', date, mask='has_filled')
+        elif date is not None:
             if date in self._broker.filled_order.keys():
                 date = pd.Timestamp(date)
                 temp = self._broker.filled_order[date]
@@ -367,7 +541,9 @@ class FastStrategy(metaclass=abc.ABCMeta):
             index * sids
             sids中只包括曾有有过未成交订单的
         """
-        if date is not None:
+        if self._broker.recorder is not None:
+            temp = self._recorded_quantity('unfilled_order', date, mask='has_unfilled')
+        elif date is not None:
             date = pd.Timestamp(date)
             if date in self._broker.unfilled_order.keys():
                 temp = self._broker.unfilled_order[date]
@@ -379,6 +555,37 @@ class FastStrategy(metaclass=abc.ABCMeta):
             temp = temp[(temp.fillna(0.) != 0.).any(axis=1)].T
         return temp
 
+    def history_book(self, date=None):
+        """
+        返回每个bar结束后留在order book中、之后继续撮合的数量 (carry_over), 若给定日期，则只返回给定的那一日
+
+        Parameters
+        ----------
+        date: str, timestamp
+            对应交易日
+
+        Returns
+        ------
+        pd.DataFrame
+            index * sids
+            sids中只包括曾在order book中的
+        """
+        book = {k: self._book_series(v) for k, v in self._broker.book.items()}
+        if date is not None:
+            return book.get(pd.Timestamp(date))
+        if not book:
+            return pd.DataFrame(dtype=float)
+        return pd.DataFrame(book).T
+
+    def _book_series(self, quantity):
+        """order book中的数量转换为以sid为index的pd.Series"""
+        if isinstance(quantity, SparseVector):
+            return pd.Series(quantity.values, index=self._datasource.sids[quantity.ids])
+        if isinstance(quantity, np.ndarray):
+            loc = np.flatnonzero(quantity)
+            return pd.Series(quantity[loc], index=self._datasource.sids[loc])
+        return quantity
+
     def history_order(self, date=None):
         """
         返回当日创建的所有订单, 若给定日期, 则返回给定的那一日
@@ -392,7 +599,7 @@ class FastStrategy(metaclass=abc.ABCMeta):
         -------
         list
         """
-        res = self._broker.place_order
+        res = self._broker.placed_order
         if date is not None:
             date = pd.Timestamp(date)
             res = [x for x in res if x.create_time==date]
@@ -408,6 +615,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
         pd.Series
             date
         """
+        if self._broker.recorder is not None:
+            return self._broker.recorder.series('holding_num')
         temp ={x: self._broker.pos[x].fillna(0.).astype(bool).astype(int).abs().sum() for x in self._broker.pos}
         return pd.Series(temp)
 
@@ -420,6 +629,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
         ------
         pd.Series
         """
+        if self._broker.recorder is not None:
+            return self._broker.recorder.series('realizable_value')
         return pd.Series(self._broker.realizable_value)
 
     @property
@@ -431,6 +642,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
         ------
         pd.Series
         """
+        if self._broker.recorder is not None:
+            return self._broker.recorder.series('cash')
         return pd.Series(self._broker.cash)
 
     @property
@@ -442,6 +655,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
         ------
         pd.Series
         """
+        if self._broker.recorder is not None:
+            return self._broker.recorder.series('turnover', mask='has_filled')
         return pd.Series(self._broker.turnover)
 
     @property
@@ -453,6 +668,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
         ------
         pd.Series
         """
+        if self._broker.recorder is not None:
+            return self._broker.recorder.series('transaction_cost', mask='has_filled')
         return pd.Series(self._broker.transaction_cost)
 
     @property
@@ -464,6 +681,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
         ------
         pd.Series
         """
+        if self._broker.recorder is not None:
+            return self._broker.recorder.series('market_value')
         return pd.Series(self._broker.market_value)
 
     @property
@@ -475,6 +694,8 @@ class FastStrategy(metaclass=abc.ABCMeta):
         -------
         pd.Series
         """
+        if self._broker.recorder is not None:
+            return self._broker.recorder.series('cost_value')
         return pd.Series(self._broker.cost_value)
 
     def history_summary(self):
@@ -503,7 +724,44 @@ class FastStrategy(metaclass=abc.ABCMeta):
         return res
 
 
-def buy_and_hold(holding, prcs, strategy_name='default', init_cash=1e8, fill_time='next_bar', fill_method='vwap', commission=None, sllipage=None):
+class HoldingStrategy(FastStrategy):
+    """
+    非路径依赖的投资组合策略: 在每个调仓日调仓至给定的目标权重
+
+    Parameters
+    ----------
+    datasource: DataSource
+        数据源
+    env: StrategyEnvironment
+        策略环境
+    name: str
+        策略名称
+    holding: pd.DataFrame
+        投资组合 date * sid
+    corridor: float
+        rebalance的corridor
+    """
+    def __init__(self, datasource, env, name, holding, corridor=0.):
+        super().__init__(datasource, env, name)
+        self._holding = holding
+        self._corridor = corridor
+        if env.engine != 'pandas':
+            # 持仓对齐到数据源的sid, 调仓日 -> 行号
+            holding_arr = holding.reindex(columns=self._datasource.sids).to_numpy(dtype=float)
+            if env.engine == 'sparse':
+                holding_arr = [SparseVector.from_dense(x) for x in holding_arr]
+            self._holding_arr = holding_arr
+            self._holding_loc = {t: i for i, t in enumerate(holding.index)}
+
+    def _on_data(self):
+        if self._env.engine != 'pandas':
+            if self.context.cur_time in self._holding_loc:
+                self.rebalance(self._holding_arr[self._holding_loc[self.context.cur_time]], corridor=self._corridor)
+        elif self.context.cur_time in self._holding.index:
+            self.rebalance(self._holding.loc[self.context.cur_time], corridor=self._corridor)
+
+
+def buy_and_hold(holding, prcs, strategy_name='default', init_cash=1e8, fill_time='next_bar', fill_method='vwap', commission=None, sllipage=None, engine='pandas', corridor=0.):
     """
     给定非路径依赖的投资组合，进行回测，返回strategy instance
 
@@ -525,6 +783,11 @@ def buy_and_hold(holding, prcs, strategy_name='default', init_cash=1e8, fill_tim
         交易佣金， 默认0.1%
     sllipage: float
         交易滑点, 默认0.2%
+    engine: str
+        pandas, array, sparse (持仓在载入时一次性对齐为 date * sid 的数组),
+        vectorized (按调仓日向量化计算, 不考虑现金约束, 返回VectorizedHoldingStrategy)
+    corridor: float
+        调仓的corridor, 见FastStrategy.rebalance
 
     Returns
     ------
@@ -537,20 +800,14 @@ def buy_and_hold(holding, prcs, strategy_name='default', init_cash=1e8, fill_tim
     holding = holding.dropna(axis=1, how='all')
     
     # 数据源
-    ds = BacktestDataSource(prcs.copy(), start_date, sids_list=holding.columns)
+    ds = BacktestDataSource(prcs, start_date, sids_list=holding.columns, dense=engine != 'pandas')
     # 市场环境设置
-    env = StrategyEnvironment(init_cash, fill_time, fill_method, commission, sllipage)
-
-    # 定义策略
-    class simple_bt_strategy(FastStrategy):
-        def __init__(self, datasource, env, name):
-            super().__init__(datasource, env, name)
-        def _on_data(self):
-            if Context.cur_time in holding.index:
-                self.rebalance(holding.loc[Context.cur_time])
-    
-    str_inst = simple_bt_strategy(ds, env, strategy_name)
+    env = StrategyEnvironment(init_cash, fill_time, fill_method, commission, sllipage, engine)
+
+    if engine == 'vectorized':
+        str_inst = VectorizedHoldingStrategy(ds, env, strategy_name, holding, corridor)
+    else:
+        str_inst = HoldingStrategy(ds, env, strategy_name, holding, corridor)
     str_inst.run()
 
     return str_inst
-
@@ -0,0 +1,158 @@
+"""
+参数扫描
+
+对同一份行情的多组参数并行回测, 行情面板通过共享内存传递给各个进程, 不会对每个进程pickle一份
+"""
+
+import os
+import inspect
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .datasource import BacktestDataSource
+from .strategy import FastStrategy, HoldingStrategy, StrategyEnvironment
+from .vectorized import VectorizedHoldingStrategy
+
+
+# StrategyEnvironment的参数, 其余参数传入策略
+ENV_PARAMS = tuple(k for k in inspect.signature(StrategyEnvironment.__init__).parameters if k != 'self')
+
+# worker进程中的共享内存, 数据源与策略
+_worker = {}
+
+
+def _expand_grid(param_grid):
+    """参数网格展开为参数名与每一组参数"""
+    if isinstance(param_grid, dict):
+        names = list(param_grid)
+        return names, [dict(zip(names, v)) for v in itertools.product(*param_grid.values())]
+    params = [dict(x) for x in param_grid]
+    names = list(params[0])
+    assert all(list(x) == names for x in params), "每一组参数的参数名应当相同"
+    return names, params
+
+
+def _share_panel(ds):
+    """将数据源的面板复制到共享内存, 返回共享内存块与其描述"""
+    blocks, spec = [], {}
+    for k, v in ds.panel.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(v.nbytes, 1))
+        arr = np.ndarray(v.shape, dtype=v.dtype, buffer=shm.buf)
+        arr[:] = v
+        blocks.append(shm)
+        spec[k] = (shm.name, v.shape, v.dtype.str)
+    return blocks, spec
+
+
+def _init_worker(spec, dates, sids, strategy, engine):
+    """worker初始化: 以只读视图的方式连接共享内存中的面板"""
+    blocks, panel = [], {}
+    for k, (name, shape, dtype) in spec.items():
+        # worker与主进程共用resource_tracker, 共享内存由主进程unlink
+        shm = shared_memory.SharedMemory(name=name)
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        arr.flags.writeable = False
+        blocks.append(shm)
+        panel[k] = arr
+    _worker.update(blocks=blocks, ds=BacktestDataSource.from_panel(panel, dates, sids),
+                   strategy=strategy, engine=engine)
+
+
+def _run_worker(params):
+    return _run(_worker['ds'], _worker['strategy'], _worker['engine'], params)
+
+
+def _run(ds, strategy, engine, params):
+    """
+    回测一组参数, 返回history_summary
+
+    ENV_PARAMS中的参数用于StrategyEnvironment, 其余参数传入策略类或持仓生成函数.
+    参数中给定engine时替代parameter_sweep的engine
+    """
+    env_kw = {k: v for k, v in params.items() if k in ENV_PARAMS}
+    str_kw = {k: v for k, v in params.items() if k not in ENV_PARAMS}
+    engine = env_kw.pop('engine', engine)
+    env = StrategyEnvironment(engine=engine, **env_kw)
+    holding = None
+    if isinstance(strategy, type) and issubclass(strategy, FastStrategy):
+        str_inst = strategy(ds, env, 'sweep', **str_kw)
+    else:
+        corridor = str_kw.pop('corridor', 0.)
+        holding = strategy(**str_kw)
+        if engine == 'vectorized':
+            str_inst = VectorizedHoldingStrategy(ds, env, 'sweep', holding, corridor)
+        else:
+            str_inst = HoldingStrategy(ds, env, 'sweep', holding, corridor)
+    str_inst.run(progress=False)
+
+    res = str_inst.history_summary()
+    if holding is not None:
+        # 与buy_and_hold一致, 从第一个调仓日开始
+        res = res.loc[min(holding.index):]
+    return res
+
+
+def parameter_sweep(strategy, param_grid, prcs, start_date=None, end_date=None, sids_list=None,
+                    engine='array', n_workers=None):
+    """
+    多组参数的并行回测
+
+    Parameters
+    ----------
+    strategy: FastStrategy subclass, callable
+        策略类, 以 strategy(datasource, env, name, **params) 创建;
+        或持仓生成函数, 以 strategy(**params) 返回 date * sid 的持仓, 以HoldingStrategy回测
+        (使用进程池时应当是可以import的模块级对象)
+    param_grid: dict, list of dict
+        参数网格 {参数名: 取值list}, 或每一组参数的list.
+        StrategyEnvironment的参数 (ENV_PARAMS: init_cash, fill_time, use_numba, engine, carry_over 等)
+        用于StrategyEnvironment, 其余参数 (如corridor) 传入策略
+    prcs: pd.DataFrame, BacktestDataSource
+        行情(index sid的MultiIndex), 或dense的数据源
+    start_date, end_date, sids_list:
+        prcs为pd.DataFrame时用于构建数据源
+    engine: str
+        pandas, array, sparse, vectorized (vectorized只用于持仓生成函数), param_grid中的engine优先
+    n_workers: int, optional
+        进程数, 默认为cpu个数, 不大于1时在当前进程中依次运行
+
+    Returns
+    -------
+    pd.DataFrame
+        各组参数的history_summary, index为 (参数..., date)
+    """
+    names, params = _expand_grid(param_grid)
+    if isinstance(prcs, BacktestDataSource):
+        ds = prcs
+    else:
+        ds = BacktestDataSource(prcs, start_date, end_date, sids_list, dense=True)
+    assert ds.dense, "parameter_sweep需要dense的数据源"
+
+    defaults = {}
+    if not (isinstance(strategy, type) and issubclass(strategy, FastStrategy)):
+        # 持仓生成函数与buy_and_hold的默认初始资金一致
+        defaults['init_cash'] = 1e8
+    run_params = [dict(defaults, **p) for p in params]
+
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    if n_workers <= 1 or len(params) <= 1:
+        results = [_run(ds, strategy, engine, p) for p in run_params]
+    else:
+        blocks, spec = _share_panel(ds)
+        try:
+            with ProcessPoolExecutor(min(n_workers, len(params)), initializer=_init_worker,
+                                     initargs=(spec, ds.dates, ds.sids, strategy, engine)) as pool:
+                results = list(pool.map(_run_worker, run_params))
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    keys = [tuple(p[k] for k in names) for p in params]
+    if len(names) == 1:
+        keys = [k[0] for k in keys]
+    return pd.concat(results, keys=keys, names=names + ['date'])
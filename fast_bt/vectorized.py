@@ -0,0 +1,189 @@
+"""
+非路径依赖投资组合的向量化回测
+"""
+
+import numpy as np
+import pandas as pd
+
+from .kernels import fill_arrays, rebalance_shares
+
+
+class VectorizedHoldingStrategy:
+    """
+    向量化的HoldingStrategy
+
+    目标权重组合的回测中, 仓位只在调仓的成交日变化, 两次成交之间的证券价值即为
+    收盘价矩阵与固定仓位的乘积. 因此只需按调仓日循环计算成交 (每次对全部证券向量化),
+    净值路径按成交日分段以矩阵运算一次得到, 无需逐bar的事件循环.
+
+    调仓逻辑与FastStrategy.rebalance一致 (按开盘价计算目标股数并取整, corridor过滤,
+    滑点、佣金与卖出印花税). 行情中有amount时与事件循环一样按成交额上限
+    (max_trading_percentage) 撮合, 超出的部分撤销; 不考虑现金约束
+
+    Parameters
+    ----------
+    datasource: BacktestDataSource
+        dense的数据源
+    env: StrategyEnvironment
+        策略环境
+    name: str
+        策略名称
+    holding: pd.DataFrame
+        投资组合 date * sid
+    corridor: float
+        rebalance的corridor
+    bench_price: str
+        计算目标股数所用的价格
+    """
+    def __init__(self, datasource, env, name, holding, corridor=0., bench_price='open'):
+        assert datasource.dense, "vectorized引擎需要dense的数据源"
+        self._datasource = datasource
+        self._env = env
+        self._name = name
+        self._holding = holding
+        self._corridor = corridor
+        self._bench_price = bench_price
+        self._summary = None
+
+    def run(self, progress=False):
+        """
+        计算回测结果
+
+        Parameters
+        ----------
+        progress: bool
+            与FastStrategy.run的接口保持一致, 无进度条
+        """
+        ds = self._datasource
+        ds.check_unchanged()
+        param = self._env.trading_param
+        n_dates, n_sids = len(ds.dates), len(ds.sids)
+        close = ds.panel['close']
+        bench = ds.panel[self._bench_price]
+        fill_prc = ds.panel[self._env.fill_strategy.fill_method]
+        amount = ds.panel.get('amount')
+        this_bar = self._env.fill_time == 'this_bar'
+
+        weights = np.nan_to_num(self._holding.reindex(columns=ds.sids).to_numpy(dtype=float))
+        rebalance_loc = ds.dates.get_indexer(self._holding.index)
+
+        cash = self._env.init_cash
+        pos = np.zeros(n_sids)
+        # 成交日的现金变动、交易额、交易成本、成交金额
+        cash_chg = np.zeros(n_dates)
+        turnover = np.zeros(n_dates)
+        transaction_cost = np.zeros(n_dates)
+        transaction_amount = np.zeros(n_dates)
+        # 仓位变化的成交日与成交后的仓位
+        fill_loc, fill_pos = [], []
+        for k in np.argsort(rebalance_loc, kind='stable'):
+            t = rebalance_loc[k]
+            t_fill = t if this_bar else t + 1
+            if t < 0 or t_fill >= n_dates:
+                continue
+            # 下单时的组合总值: this_bar时为上一bar收盘后的值
+            t_value = t - 1 if this_bar else t
+            total_value = cash if t_value < 0 else np.nansum(pos * close[t_value]) + cash
+            corridor = self._corridor * total_value if 1. > self._corridor > 0. else self._corridor
+
+            dif = rebalance_shares(weights[k], pos, bench[t], total_value, corridor,
+                                   use_numba=self._env.use_numba)
+
+            # 成交, 价格非正或缺失的证券不成交, 有amount时按成交额上限截断
+            _, dif, abs_amt, net_amt, cost = fill_arrays(
+                dif, fill_prc[t_fill], None if amount is None else amount[t_fill],
+                param.sllipage, param.commission, param.max_trading_percentage,
+                use_numba=self._env.use_numba)
+
+            pos = pos + dif
+            cash = cash - net_amt - cost
+            cash_chg[t_fill] += -net_amt - cost
+            turnover[t_fill] += abs_amt
+            transaction_cost[t_fill] += cost
+            transaction_amount[t_fill] += net_amt
+            fill_loc.append(t_fill)
+            fill_pos.append(pos)
+
+        # 按成交日分段计算证券价值
+        security_value = np.zeros(n_dates)
+        market_value = np.zeros(n_dates)
+        holding_num = np.zeros(n_dates, dtype=int)
+        bounds = fill_loc + [n_dates]
+        for k, p in enumerate(fill_pos):
+            rows = slice(bounds[k], bounds[k + 1])
+            value = close[rows] * p
+            security_value[rows] = np.nansum(value, axis=1)
+            market_value[rows] = np.nansum(np.abs(value), axis=1)
+            holding_num[rows] = np.count_nonzero(p)
+        self._fill_loc, self._fill_pos = fill_loc, fill_pos
+
+        dates = ds.dates
+        res = pd.DataFrame(index=dates)
+        res['cash'] = self._env.init_cash + np.cumsum(cash_chg)
+        res['security_value'] = security_value
+        res['transaction_cost'] = transaction_cost
+        res['turnover'] = turnover
+        res['holding_num'] = holding_num
+        res['leverage'] = market_value
+        res['nav'] = res['cash'] + res['security_value']
+        self._summary = res
+        self._cost_value = pd.Series(np.cumsum(transaction_amount), index=dates)
+
+    # ------------------- 用户获取信息的方法 ---------------------
+
+    def history_pos(self, date=None):
+        """
+        返回投资组合持仓, 若给定日期，则只返回给定的那一日
+
+        Returns
+        -------
+        pd.DataFrame
+            index * sids
+            sids中只包括曾经有过持仓的
+        """
+        ds = self._datasource
+        pos = np.zeros((len(ds.dates), len(ds.sids)))
+        bounds = self._fill_loc + [len(ds.dates)]
+        for k, p in enumerate(self._fill_pos):
+            pos[bounds[k]:bounds[k + 1]] = p
+        pos = pd.DataFrame(pos, index=ds.dates, columns=ds.sids)
+        if date is not None:
+            temp = pos.loc[pd.Timestamp(date)]
+            return temp[temp.abs() > 0.]
+        return pos.loc[:, (pos != 0.).any(axis=0).to_numpy()]
+
+    @property
+    def history_holding_num(self):
+        return self._summary['holding_num']
+
+    @property
+    def history_realizable_value(self):
+        return self._summary['security_value']
+
+    @property
+    def history_cash(self):
+        return self._summary['cash']
+
+    @property
+    def history_turnover(self):
+        return self._summary['turnover']
+
+    @property
+    def history_transaction_cost(self):
+        return self._summary['transaction_cost']
+
+    @property
+    def history_market_value(self):
+        return self._summary['leverage']
+
+    @property
+    def history_cost_value(self):
+        return self._cost_value
+
+    def history_summary(self):
+        """
+        返回回测时间序列总结
+
+        包括: cash, security_value, transaction_cost, turnover, holding_num, leverage, nav
+        """
+        return self._summary.copy()
@@ -2,4 +2,4 @@
 基于ricequant回测的慢速回测
 """
 
-from .core import rq_backtest
\ No newline at end of file
+from .core import rq_backtest, rq_backtest_batch
@@ -1,15 +1,73 @@
 """
 """
 
+import os
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd 
 
 from rqalpha import api, run_func
 
 from . import utils 
 from .config import init_stock_config
+from .recorder import WeightRecorder
+
+logger = logging.getLogger(__name__)
+
+
+def _index_by_date(holding):
+    """
+    按调仓日预先索引持仓
 
+    Returns
+    -------
+    dict
+        datetime.date -> 目标权重 np.ndarray, 与holding.columns对齐
+    """
+    weights = holding.to_numpy(dtype=float)
+    return {pd.Timestamp(td).date(): weights[i] for i, td in enumerate(holding.index)}
 
-def rq_backtest(holding, benchmark, matching='next_close', init_cash=1e8, slippage=0.002, plot=True, log_level='error', start_date=None, end_date=None):
+
+def _rebalance(context, bar_dict, target, sid_index, price_field):
+    """
+    调仓至目标权重: 先下所有卖单, 买单延后
+
+    只对持仓证券读取当前权重, 卖单与买单在数组上一次确定, 只有权重变化的证券向rqalpha下单
+
+    Parameters
+    ----------
+    target: np.ndarray
+        目标权重, 与context.stock_sids对齐
+    sid_index: dict
+        sid -> 在context.stock_sids中的位置
+    price_field: str
+        计算当前权重所用的价格, open, close
+    """
+    positions = context.portfolio.positions
+    portfolio_value = context.portfolio.portfolio_value
+    current = np.zeros(len(target))
+    held = np.zeros(len(target), dtype=bool)
+    for stk in positions:
+        i = sid_index.get(stk)
+        if i is not None:
+            held[i] = True
+            current[i] = positions[stk].quantity * getattr(bar_dict[stk], price_field) / portfolio_value
+    # 只对持仓证券下卖单, 当前权重为nan(无行情)时不调仓
+    sell = np.flatnonzero((target < current) & held)
+    buy = np.flatnonzero((target > current) & (target > 0.))
+    sids = context.stock_sids
+    for i in sell:
+        api.order_target_percent(sids[i], float(target[i]))
+    # 所有买单
+    for i in buy:
+        api.order_target_percent(sids[i], float(target[i]))
+
+
+def rq_backtest(holding, benchmark, matching='next_close', init_cash=1e8, slippage=0.002, plot=True, log_level='error', start_date=None, end_date=None,
+                data_bundle_path="/srv/data/rqbundle/bundle"):
     """
     使用rqalpha的回测引擎进行回测
 
@@ -30,6 +88,8 @@ def rq_backtest(holding, benchmark, matching='next_close', init_cash=1e8, slippa
         是否进行绘图
     log_level: str 
         进行log记录的等级：debug, info, warn, error
+    data_bundle_path: str
+        rqalpha数据源地址
     
     Returns
     -------
@@ -37,16 +97,23 @@ def rq_backtest(holding, benchmark, matching='next_close', init_cash=1e8, slippa
 
     """
     holding = holding.copy()
-    holding.columns = [utils.convert_to_rq_code(x) for x in holding.columns]
+    holding.columns = utils.convert_to_rq_code(holding.columns)
     start_date = min(holding.index) if start_date is None else pd.Timestamp(start_date)
     end_date = max(holding.index) if end_date is None else pd.Timestamp(end_date)
     holding = holding.fillna(0.)
 
     config = init_stock_config(start_date, end_date, benchmark, matching_type="current_bar", slippage=slippage, 
-                               init_cash=init_cash, plot=plot, data_bundle_path="/srv/data/rqbundle/bundle", log_level=log_level)
+                               init_cash=init_cash, plot=plot, data_bundle_path=data_bundle_path, log_level=log_level)
+
+    # 调仓日 -> 目标权重, 按日期预先索引
+    target_by_date = _index_by_date(holding)
+    sids = holding.columns.tolist()
+    sid_index = {stk: i for i, stk in enumerate(sids)}
+    # 逐日记录持仓权重
+    recorder = WeightRecorder(sids, start_date, end_date)
 
     def init(context):
-        context.stock_sids = holding.columns.tolist()
+        context.stock_sids = sids
         context.if_rebalance = False 
     
     def before_trading(context):
@@ -54,103 +121,37 @@ def rq_backtest(holding, benchmark, matching='next_close', init_cash=1e8, slippa
     
     if matching == 'next_close':
         def after_trading(context):
-            td = pd.Timestamp(context.now).date()
-            if td in holding.index:
+            recorder.record(context)
+            target = target_by_date.get(pd.Timestamp(context.now).date())
+            if target is not None:
                 context.if_rebalance = True 
-                context.target_weight = holding.loc[td]
+                context.target_weight = target
 
         def handle_bar(context, bar_dict):
             # 调仓日
             if context.if_rebalance:
-                # 买单延后
-                buy_dict = dict()
-                target_p = context.target_weight
-                for stk in context.stock_sids:
-                    # 当前存在持仓, 下卖单并记录买单
-                    if stk in context.portfolio.positions:
-                        current_wgt = context.portfolio.positions[stk].quantity * bar_dict[stk].open / context.portfolio.portfolio_value
-                        target_weight = target_p.loc[stk]
-                        if target_weight < current_wgt:
-                            api.order_target_percent(stk, target_weight)
-                        elif target_weight > current_wgt:
-                            buy_dict.update({stk: target_weight})
-                        else:
-                            # 无需调仓
-                            pass
-                    # 当前不存在持仓，存入买单
-                    else:
-                        target_weight = target_p.loc[stk]
-                        buy_dict.update({stk: target_weight})
-                # 所有买单
-                for i in buy_dict:
-                    if buy_dict[i] > 0:
-                        api.order_target_percent(i, buy_dict[i])
+                _rebalance(context, bar_dict, context.target_weight, sid_index, 'open')
                 context.if_rebalance = False
     
     elif matching == 'current_close':
         def after_trading(context):
-            pass 
+            recorder.record(context)
         def handle_bar(context, bar_dict):
             # 调仓日
-            td = pd.Timestamp(context.now).date()
-            if td in holding.index:
-                context.target_weight = holding.loc[td]
-                # 买单延后
-                buy_dict = dict()
-                target_p = context.target_weight
-                for stk in context.stock_sids:
-                    # 当前存在持仓, 下卖单并记录买单
-                    if stk in context.portfolio.positions:
-                        current_wgt = context.portfolio.positions[stk].quantity * bar_dict[stk].open / context.portfolio.portfolio_value
-                        target_weight = target_p.loc[stk]
-                        if target_weight < current_wgt:
-                            api.order_target_percent(stk, target_weight)
-                        elif target_weight > current_wgt:
-                            buy_dict.update({stk: target_weight})
-                        else:
-                            # 无需调仓
-                            pass
-                    # 当前不存在持仓，存入买单
-                    else:
-                        target_weight = target_p.loc[stk]
-                        buy_dict.update({stk: target_weight})
-                # 所有买单
-                for i in buy_dict:
-                    if buy_dict[i] > 0:
-                        api.order_target_percent(i, buy_dict[i])
-
+            target = target_by_date.get(pd.Timestamp(context.now).date())
+            if target is not None:
+                context.target_weight = target
+                _rebalance(context, bar_dict, target, sid_index, 'open')
 
     elif matching == 'next_open':
         config['mod']['sys_simulation']['matching_type'] = 'next_bar'
         
         def after_trading(context):
-            pass 
+            recorder.record(context)
         def handle_bar(context, bar_dict):
-            td = pd.Timestamp(context.now).date()
-            if td in holding.index:
-                target_p = holding.loc[td]
-                # 买单延后
-                buy_dict = dict()
-                for stk in context.stock_sids:
-                    # 当前存在持仓, 下卖单并记录买单
-                    if stk in context.portfolio.positions:
-                        current_wgt = context.portfolio.positions[stk].quantity * bar_dict[stk].close / context.portfolio.portfolio_value
-                        target_weight = target_p.loc[stk]
-                        if target_weight < current_wgt:
-                            api.order_target_percent(stk, target_weight)
-                        elif target_weight > current_wgt:
-                            buy_dict.update({stk: target_weight})
-                        else:
-                            # 无需调仓
-                            pass
-                    # 当前不存在持仓，存入买单
-                    else:
-                        target_weight = target_p.loc[stk]
-                        buy_dict.update({stk: target_weight})
-                # 所有买单
-                for i in buy_dict:
-                    if buy_dict[i] > 0:
-                        api.order_target_percent(i, buy_dict[i])
+            target = target_by_date.get(pd.Timestamp(context.now).date())
+            if target is not None:
+                _rebalance(context, bar_dict, target, sid_index, 'close')
     else:
         raise NotImplementedError("当前只支持next_close, next_open两种成交方式")
 
@@ -166,11 +167,11 @@ def rq_backtest(holding, benchmark, matching='next_close', init_cash=1e8, slippa
     res = res['sys_analyser']
     res['summary'] = pd.Series(res['summary'])
 
+    # 成交记录由sys_analyser在回测中逐笔记录并生成DataFrame, 在hook中另外记录只会多保留一份;
+    # 此处只对不重复的代码转换一次, 日期整列转换, 不逐行处理
     res['trades']['order_book_id'] = utils.convert_to_jy_code(res['trades']['order_book_id'])
-    res['trades'].index = pd.to_datetime(res['trades'].index)
-    res['trades'].index = [x.date() for x in res['trades'].index]
+    res['trades'].index = pd.Index(pd.to_datetime(res['trades'].index).date, name='date')
     res['trades'] = res['trades'].rename(columns={'order_book_id': 'sid'})
-    res['trades'].index.name = 'date'
 
     res['portfolio']['benchmark_net_value'] = res['benchmark_portfolio']['unit_net_value']
     del res['benchmark_portfolio']
@@ -178,12 +179,70 @@ def rq_backtest(holding, benchmark, matching='next_close', init_cash=1e8, slippa
     res['stock_positions']['order_book_id'] = utils.convert_to_jy_code(res['stock_positions']['order_book_id'])
     res['stock_positions'] = res['stock_positions'].rename(columns={'order_book_id': 'sid'})
     
-    res['stock_weight'] = res['stock_positions'].reset_index().pivot(index='date', columns='sid', values='market_value').div(
-        res['stock_account']['total_value'], axis=0
-    )
+    # 回测中记录的权重矩阵, 无需pivot
+    res['stock_weight'] = recorder.to_frame()
+    res['stock_weight'].columns = utils.convert_to_jy_code(res['stock_weight'].columns)
+    res['stock_weight'].columns.name = 'sid'
     del res['stock_account']
     
-    return res 
+    return res
+
+
+def _resolve_bundle_path(data_bundle_path):
+    """数据源的绝对路径, 不存在时报错"""
+    path = os.path.abspath(os.path.expanduser(data_bundle_path))
+    if not os.path.isdir(path):
+        raise FileNotFoundError("rqalpha数据源不存在: {}".format(path))
+    return path
+
+
+def rq_backtest_batch(holdings, benchmark, n_workers=None, data_bundle_path="/srv/data/rqbundle/bundle", **kwargs):
+    """
+    多个组合的并行rqalpha回测
 
+    数据源路径只解析一次, 每个组合在进程池中独立运行, 某个组合失败不影响其余的组合
 
-    
\ No newline at end of file
+    Parameters
+    ----------
+    holdings: dict, list
+        组合名称 -> 策略持仓 date * sid, 为list时以下标为名称
+    benchmark: str
+        业绩基准
+    n_workers: int, optional
+        进程数, 默认为cpu个数, 不大于1时在当前进程中依次运行
+    data_bundle_path: str
+        rqalpha数据源地址
+    kwargs:
+        rq_backtest的其余参数, plot默认为False
+
+    Returns
+    -------
+    dict
+        组合名称 -> rq_backtest的结果, 失败的组合为其异常 (traceback记录在日志中),
+        可以通过 isinstance(res, Exception) 区分
+    """
+    if not isinstance(holdings, dict):
+        holdings = dict(enumerate(holdings))
+    kwargs = dict(kwargs, data_bundle_path=_resolve_bundle_path(data_bundle_path))
+    kwargs.setdefault('plot', False)
+
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    results = {}
+    if n_workers <= 1 or len(holdings) <= 1:
+        for name, holding in holdings.items():
+            try:
+                results[name] = rq_backtest(holding, benchmark, **kwargs)
+            except Exception as e:
+                logger.error("【{}】回测失败:\n{}".format(name, traceback.format_exc()))
+                results[name] = e
+    else:
+        with ProcessPoolExecutor(min(n_workers, len(holdings))) as pool:
+            futures = {name: pool.submit(rq_backtest, holding, benchmark, **kwargs) for name, holding in holdings.items()}
+            for name, future in futures.items():
+                # 回测中的异常, 或worker进程异常退出等; 子进程的traceback在异常的__cause__中
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logger.error("【{}】回测失败:\n{}".format(name, traceback.format_exc()))
+                    results[name] = e
+    return results
@@ -0,0 +1,73 @@
+"""
+回测过程中的结果记录
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class WeightRecorder:
+    """
+    逐日记录持仓权重的列式记录器
+
+    在回测开始前按 date * sid 预先分配权重数组 (行数为起止日期间的工作日数, 不足时扩容),
+    在after_trading中每日写入一行, 回测结束后直接得到权重矩阵, 无需对stock_positions进行pivot
+
+    Parameters
+    ----------
+    sids: list, pd.Index
+        策略持仓的证券代码 (rqalpha格式), 只对这些证券下单
+    start_date, end_date: timestamp
+        回测起止时间
+
+    Attributes
+    ----------
+    n: int
+        已经记录的交易日数
+    dates: np.ndarray
+        交易日, datetime64
+    weight: np.ndarray
+        date * sid 持仓市值 / 账户总价值, 无持仓为nan
+    """
+    def __init__(self, sids, start_date, end_date):
+        self.sids = pd.Index(sids)
+        self.sid_index = {stk: i for i, stk in enumerate(self.sids)}
+        self.n = 0
+        n_dates = max(len(pd.bdate_range(start_date, end_date)), 1)
+        self.dates = np.empty(n_dates, dtype='datetime64[ns]')
+        self.weight = np.full((n_dates, len(self.sids)), np.nan)
+
+    def _grow(self):
+        """容量翻倍"""
+        n_dates = len(self.dates)
+        self.dates = np.concatenate([self.dates, np.empty(n_dates, dtype=self.dates.dtype)])
+        self.weight = np.concatenate([self.weight, np.full_like(self.weight, np.nan)])
+
+    def record(self, context):
+        """记录当日收盘后的持仓权重, 写入第self.n行"""
+        if self.n == len(self.dates):
+            self._grow()
+        i = self.n
+        self.dates[i] = pd.Timestamp(context.now).normalize().to_datetime64()
+        total_value = context.stock_account.total_value
+        positions = context.portfolio.positions
+        for stk in positions:
+            j = self.sid_index.get(stk)
+            if j is not None:
+                self.weight[i, j] = positions[stk].market_value / total_value
+        self.n += 1
+
+    def to_frame(self):
+        """
+        持仓权重
+
+        Returns
+        -------
+        pd.DataFrame
+            date * sid, 与stock_positions一致, 只包括有持仓的交易日与曾经持有的证券
+        """
+        valid = ~np.isnan(self.weight[:self.n])
+        rows = valid.any(axis=1)
+        cols = valid.any(axis=0)
+        return pd.DataFrame(self.weight[:self.n][np.ix_(rows, cols)],
+                            index=pd.DatetimeIndex(self.dates[:self.n][rows], name='date'), columns=self.sids[cols])
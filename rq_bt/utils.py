@@ -2,6 +2,13 @@
 rqalpha回测工具
 """
 
+import functools
+
+import numpy as np
+import pandas as pd
+
+
+@functools.lru_cache(maxsize=None)
 def _switch_code_to_rq(code: str):
     """将股票代码转换成rqalpha中可用的，XSHG 为上证，XSHE 为深证"""
     # 
@@ -17,6 +24,7 @@ def _switch_code_to_rq(code: str):
     return code.split('.')[0] + suffix
 
 
+@functools.lru_cache(maxsize=None)
 def _switch_code_to_wind(code:str):
     """
     将股票代码转化为wind的格式, SH为上证，SZ为深证
@@ -31,6 +39,7 @@ def _switch_code_to_wind(code:str):
     return code.split(".")[0] + suffix
 
 
+@functools.lru_cache(maxsize=None)
 def _switch_code_to_jy(code:str):
     """
     将股票代码转化为聚源支持的格式(000001)
@@ -38,19 +47,45 @@ def _switch_code_to_jy(code:str):
     return code.split(".")[0]
 
 
+def _convert(code, switch):
+    """
+    按代码映射表转换代码: 对不重复的代码逐个转换(结果缓存), 再按下标展开
+
+    Series(包括Categorical)与Index返回相同类型, 缺失值保持缺失, 其余的可迭代对象返回list
+    """
+    if isinstance(code, str):
+        return switch(code)
+    if isinstance(code, pd.Series) and isinstance(code.dtype, pd.CategoricalDtype):
+        cats = np.array([switch(x) for x in code.cat.categories], dtype=object)
+        # 不同的代码可能转换为同一个代码, 重新编码
+        new_codes, new_cats = pd.factorize(cats)
+        codes = code.cat.codes.to_numpy()
+        codes = np.where(codes >= 0, new_codes[codes], -1)
+        return pd.Series(pd.Categorical.from_codes(codes, new_cats), index=code.index, name=code.name)
+    if not isinstance(code, (pd.Series, pd.Index, np.ndarray)):
+        code = np.asarray(list(code), dtype=object)
+    codes, uniques = pd.factorize(code)
+    converted = np.array([switch(x) for x in uniques], dtype=object)
+    values = converted.take(codes)
+    if (codes < 0).any():
+        values[codes < 0] = np.nan
+    if isinstance(code, pd.Series):
+        return pd.Series(values, index=code.index, name=code.name)
+    if isinstance(code, pd.Index):
+        return pd.Index(values, name=code.name)
+    return values.tolist()
+
+
 def convert_to_rq_code(code):
     """
     将股票代码转换为rqalpha可用格式
 
     Parameters
     ----------
-    code: str, list
+    code: str, list, pd.Series, pd.Index
         待转换的代码
     """
-    if isinstance(code, str):
-        return _switch_code_to_rq(code)
-    else:
-        return [_switch_code_to_rq(x) for x in code]
+    return _convert(code, _switch_code_to_rq)
 
 def convert_to_wind_code(code):
     """
@@ -58,13 +93,10 @@ def convert_to_wind_code(code):
 
     Parameters
     ---------
-    code: str, list
+    code: str, list, pd.Series, pd.Index
         待转换的代码
     """
-    if isinstance(code, str):
-        return _switch_code_to_wind(code)
-    else:
-        return [_switch_code_to_wind(x) for x in code]
+    return _convert(code, _switch_code_to_wind)
 
 def convert_to_jy_code(code):
     """
@@ -72,12 +104,9 @@ def convert_to_jy_code(code):
 
     Parameters
     ----------
-    code: str, list 
+    code: str, list, pd.Series, pd.Index
         待转换的代码
     """
-    if isinstance(code, str):
-        return _switch_code_to_jy(code)
-    else:
-        return [_switch_code_to_jy(x) for x in code]
+    return _convert(code, _switch_code_to_jy)
 
 
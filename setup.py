@@ -19,5 +19,8 @@ setuptools.setup(
     install_requires=[
         "numpy",
         "pandas"
-    ]
+    ],
+    extras_require={
+        "numba": ["numba"]
+    }
 )
\ No newline at end of file
@@ -4,4 +4,5 @@
 
 from .utils import compounding_forward_prc,  compounding_forward_ret
 from . import ic 
-from .longshort import long_short_backtest
\ No newline at end of file
+from .cache import DiskCache
+from .longshort_portfolio import long_short_backtest, signal_to_weights
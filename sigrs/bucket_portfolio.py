@@ -4,10 +4,97 @@
 import numpy as np 
 import pandas as pd 
 
-def cal_sort_quantile(df, name, cut=4, group=None, label=None):
+def _segments(df, name, group):
+    """
+    分组所在的截面: 每个 (date, group) 为一个截面
+
+    Returns
+    -------
+    x: np.ndarray
+        变量值
+    valid: np.ndarray
+        参与分组的样本 (变量与group均非nan)
+    seg: np.ndarray
+        有效样本所在截面的编号 (从0开始连续)
+    """
+    x = df[name].to_numpy(dtype=float)
+    valid = ~np.isnan(x)
+    seg = pd.factorize(df.index.get_level_values('date'))[0].astype(np.int64)
+    if group is not None:
+        group_code, uniques = pd.factorize(df[group])
+        valid &= group_code >= 0
+        seg = seg * max(len(uniques), 1) + group_code
+    seg = pd.factorize(seg[valid])[0]
+    return x, valid, seg
+
+
+def _quantile_codes(x, seg, q):
+    """
+    截面内按分位数分组, 与pd.qcut一致: 第i组为 (edge_i, edge_i+1], 第一组包括最小值
+
+    每个截面的分位点由一次 (截面, 值) 的排序线性插值得到, 重复的分位点之间为空组
+    """
+    order = np.lexsort((x, seg))
+    sorted_x = x[order]
+    counts = np.bincount(seg)
+    starts = np.cumsum(counts) - counts
+    codes = np.zeros(len(x), dtype=np.int64)
+    for p in q[1:-1]:
+        h = p * (counts - 1)
+        lo = np.floor(h).astype(np.int64)
+        hi = np.minimum(lo + 1, counts - 1)
+        v_lo, v_hi = sorted_x[starts + lo], sorted_x[starts + hi]
+        edge = v_lo + (v_hi - v_lo) * (h - lo)
+        codes += x > edge[seg]
+    return codes
+
+
+def _bin_codes(x, seg, bins):
+    """
+    截面内等宽分组 (bins为int) 或按给定的break points分组, 与pd.cut一致
+
+    Returns
+    -------
+    codes: np.ndarray
+        组号, 不在break points范围内的为-1
+    """
+    if isinstance(bins, (list, tuple, np.ndarray)):
+        bins = np.asarray(bins, dtype=float)
+        codes = np.searchsorted(bins, x, side='left') - 1
+        codes[(x <= bins[0]) | (x > bins[-1])] = -1
+        return codes
+    n_seg = seg.max() + 1 if len(seg) else 0
+    mn = np.full(n_seg, np.inf)
+    mx = np.full(n_seg, -np.inf)
+    np.minimum.at(mn, seg, x)
+    np.maximum.at(mx, seg, x)
+    # 与pd.cut一致, 截面内所有值相同时上下扩展0.1%
+    same = mn == mx
+    adj = np.where(mn != 0., 0.001 * np.abs(mn), 0.001)
+    mn = np.where(same, mn - adj, mn)
+    mx = np.where(same, mx + adj, mx)
+    codes = np.zeros(len(x), dtype=np.int64)
+    for j in range(1, bins):
+        codes += x > (mn + (mx - mn) / bins * j)[seg]
+    return codes
+
+
+def _to_result(df, name, valid, codes, label, return_codes):
+    """组号转换为与df对齐的结果"""
+    res = np.full(len(df), -1, dtype=np.int64)
+    res[valid] = codes
+    if return_codes:
+        return pd.Series(res, index=df.index, name=name)
+    return pd.Series(pd.Categorical.from_codes(res, categories=label, ordered=True), index=df.index, name=name)
+
+
+def cal_sort_quantile(df, name, cut=4, group=None, label=None, return_codes=False):
     """
     对变量进行分组(quantile的方式)
 
+    所有 (date, group) 截面一次排序后向量化计算分位点与组号, 不逐截面调用pd.qcut.
+    分位点重复时(如大量相同值), 重复分位点之间的组为空, 而不是报错
+
     Parameters
     ----------
     df: pd.DataFrame
@@ -22,33 +109,36 @@ def cal_sort_quantile(df, name, cut=4, group=None, label=None):
         分组的conditional因素，如有也应当是df中的一列
     label: list of str, optional
         每一组的名称(由小到大)， 若不给定，则默认为1开始的序列
+    return_codes: bool
+        返回从0开始的整数组号(缺失为-1), 而不是label
     
     Returns
     ------
     res: pd.Series
-        分组结果
+        分组结果, index与df相同, 为有序的Categorical(categories为label)
     """
     if isinstance(cut, (list, tuple)):
         n = len(cut) - 1
+        q = np.asarray(cut, dtype=float)
     else:
         n = cut 
+        q = np.linspace(0., 1., cut + 1)
     
     if label is None:
         label = [str(x) for x in range(1, (n+1))]
     else:
         assert len(label) == n, "给定的label个数与分组个数不一致"
 
-    group = ['date'] if group is None else ['date', group]
-    
-    res = df.groupby(group)[name].apply(
-        lambda x: pd.qcut(x, cut, labels=label, duplicates='drop')
-    )
-    return res 
+    x, valid, seg = _segments(df, name, group)
+    codes = _quantile_codes(x[valid], seg, q)
+    return _to_result(df, name, valid, codes, label, return_codes)
 
-def cal_sort_bin(df, name, bins=4, group=None, label=None):
+def cal_sort_bin(df, name, bins=4, group=None, label=None, return_codes=False):
     """
     对变量进行分组(bin的方式)
 
+    bins为int时每个 (date, group) 截面内等宽分组, 截面的最大最小值向量化得到
+
     Parameters
     ----------
     df: pd.DataFrame
@@ -61,11 +151,13 @@ def cal_sort_bin(df, name, bins=4, group=None, label=None):
         分组的conditional因素，如有也应当是df中的一列
     label: list of str, optional
         每一组的名称(由小到大)， 若不给定，则默认为1开始的序列
+    return_codes: bool
+        返回从0开始的整数组号(缺失为-1), 而不是label
     
     Returns
     ------
     res: pd.Series
-        分组结果
+        分组结果, index与df相同, 为有序的Categorical(categories为label)
     """
     if isinstance(bins, (list, tuple)):
         n = len(bins) - 1
@@ -77,57 +169,94 @@ def cal_sort_bin(df, name, bins=4, group=None, label=None):
     else:
         assert len(label) == n, "Number of label is different from number of bins"
     
-    group = ['date'] if group is None else ['date', group]
+    x, valid, seg = _segments(df, name, group)
+    codes = _bin_codes(x[valid], seg, bins)
+    valid[valid] = codes >= 0
+    return _to_result(df, name, valid, codes[codes >= 0], label, return_codes)
 
-    res = df.groupby(group)[name].apply(
-        lambda x: pd.cut(x, bins, labels=label, duplicates='drop')
-    )
-    return res 
+def _label_codes(sort):
+    """
+    分组结果转换为整数组号
 
-def cal_bucket_ret(sort, ret, weight=None, delay=1):
+    Returns
+    -------
+    codes: np.ndarray
+        date * sid 的组号, 缺失为-1
+    labels: pd.Index
+        组号对应的label, Categorical时按categories的顺序, 否则按排序
+    """
+    dtypes = sort.dtypes
+    first = dtypes.iloc[0] if len(dtypes) else None
+    if isinstance(first, pd.CategoricalDtype) and all(x == first for x in dtypes):
+        labels = first.categories
+        codes = np.column_stack([sort[c].cat.codes.to_numpy() for c in sort.columns]).astype(np.int64)
+    else:
+        values = sort.to_numpy()
+        codes, labels = pd.factorize(values.ravel(), sort=True)
+        codes = codes.reshape(values.shape)
+    return codes, pd.Index(labels)
+
+
+def cal_bucket_ret(sort, ret, weight=None, delay=1, chunk_size=250):
     """
     Calculate bucket return 
 
+    分组label只转换一次为整数组号, 每chunk_size个交易日以一次bincount得到所有分组
+    (以及全样本'all')的加权收益率, 无需逐组构建date * sid的DataFrame
+
     Parameters
     ----------
-    sort: pd.DataFrame
-        date * sid 信号分组结果
+    sort: pd.DataFrame, pd.Series
+        date * sid 信号分组结果, 或cal_sort_quantile / cal_sort_bin的结果
     ret: pd.DataFrame
         date * sid 日频收益率
     weight: pd.DataFrame
         date * sid 收益率的加权权重，若为None则等权
     delay: int
         延后天数
+    chunk_size: int
+        每次计算的交易日数
     
     Returns
     ------
     res: pd.DataFrame
         各个分组与全样本的表现
     """
+    if isinstance(sort, pd.Series):
+        sort = sort.unstack()
+    codes, labels = _label_codes(sort)
+    n_groups = len(labels)
+
     # 对齐分组与收益率
     # 以分组的列为universe， 将分组对齐到日频(且有收益率)
-    sort, ret = sort.align(ret.loc[:, sort.columns], join='right', copy=True)
-    sort = sort.ffill().shift(delay).dropna(how='all')
+    codes = pd.DataFrame(np.where(codes >= 0, codes, np.nan), index=sort.index, columns=sort.columns)
+    codes = codes.reindex(index=ret.index).ffill().shift(delay).dropna(how='all')
+    idx = codes.index
 
     # 若不提供权重，则等权
-    if weight is None:
-        weight = pd.DataFrame(1., index=sort.index, columns=sort.columns)
-    else:
-        weight = weight.loc[:, sort.columns].reindex(ret.index).ffill().shift(delay).loc[sort.index]
-    ret = ret.loc[sort.index]
+    if weight is not None:
+        weight = weight.reindex(columns=sort.columns).reindex(ret.index).ffill().shift(delay)
+        weight = weight.loc[idx].to_numpy(dtype=float)
+    codes = codes.to_numpy()
+    ret = ret.reindex(index=idx, columns=sort.columns).to_numpy(dtype=float)
 
-    groups = np.unique(sort).tolist()
-    if 'nan' in groups:
-        groups.remove('nan')
+    num = np.zeros((len(idx), n_groups))
+    den = np.zeros((len(idx), n_groups))
+    for start in range(0, len(idx), chunk_size):
+        rows = slice(start, start + chunk_size)
+        r, c = ret[rows], codes[rows]
+        w = np.ones(r.shape) if weight is None else weight[rows]
+        mask = ~(np.isnan(c) | np.isnan(r) | np.isnan(w))
+        # 每个 (交易日, 组) 一个bin
+        loc = (np.arange(r.shape[0])[:, None] * n_groups + np.where(mask, c, 0)).astype(np.int64)[mask]
+        size = r.shape[0] * n_groups
+        num[rows] = np.bincount(loc, weights=(r * w)[mask], minlength=size).reshape(-1, n_groups)
+        den[rows] = np.bincount(loc, weights=w[mask], minlength=size).reshape(-1, n_groups)
 
-    mask = np.logical_and(sort.notna(), ret.notna()) 
-    
-    res = pd.DataFrame(index=sort.index, columns=groups)
-    for gp in groups:
-        res[gp] = (ret.where(sort == gp).where(mask) * weight.where(sort == gp)).sum(axis=1) / weight.where(sort == gp).where(mask).sum(axis=1)
-
-    res['all'] = (ret.where(mask) * weight).sum(axis=1) / weight.where(mask).sum(axis=1)
-    
-    
+    # 只包括出现过的分组, 'nan' (由astype(str)得到的缺失) 不作为分组, 但与原先一样计入'all'
+    present = np.bincount(codes[~np.isnan(codes)].astype(np.int64), minlength=n_groups) > 0
+    present = np.flatnonzero(present & (labels != 'nan'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = pd.DataFrame(num[:, present] / den[:, present], index=idx, columns=labels[present].tolist())
+        res['all'] = num.sum(axis=1) / den.sum(axis=1)
     return res 
-
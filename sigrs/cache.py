@@ -0,0 +1,250 @@
+"""
+磁盘缓存
+
+以输入数据与参数的hash为key, 将sigrs函数的结果保存在磁盘上, 相同的输入不再重复计算
+"""
+
+import os
+import pickle
+import datetime
+import hashlib
+import inspect
+import functools
+
+import numpy as np
+import pandas as pd
+
+
+# 按repr即可确定内容的类型
+_REPR_TYPES = (type(None), bool, int, float, complex, str, bytes, np.generic, np.dtype,
+               pd.Timestamp, pd.Timedelta, pd.Period, datetime.date, datetime.time, datetime.timedelta, slice,
+               type(pd.NaT))
+
+
+def _hash_array(h, arr):
+    arr = np.asarray(arr)
+    h.update('{}{}'.format(arr.dtype.str, arr.shape).encode())
+    if arr.dtype.hasobject:
+        h.update(pd.util.hash_array(arr.ravel()).tobytes())
+    else:
+        h.update(np.ascontiguousarray(arr).reshape(-1).view(np.uint8))
+
+
+def _hash_update(h, obj):
+    """将obj的内容写入hash"""
+    if isinstance(obj, pd.DataFrame):
+        h.update(b'DataFrame')
+        _hash_update(h, obj.index)
+        _hash_update(h, obj.columns)
+        dtypes = obj.dtypes
+        if len(dtypes) and not isinstance(dtypes.iloc[0], pd.CategoricalDtype) and (dtypes == dtypes.iloc[0]).all():
+            # 单一dtype时直接hash整个数组
+            h.update(str(dtypes.iloc[0]).encode())
+            # 按列连续的block转置后为C连续的视图, 无需复制
+            _hash_array(h, obj.to_numpy().T)
+            return
+        for dtype, cols in obj.columns.groupby(dtypes).items():
+            h.update(str(dtype).encode())
+            _hash_update(h, pd.Index(cols))
+            if isinstance(dtype, pd.CategoricalDtype):
+                for c in cols:
+                    _hash_update(h, obj[c])
+            else:
+                _hash_array(h, obj[cols].to_numpy().T)
+    elif isinstance(obj, pd.Series):
+        h.update(b'Series')
+        _hash_update(h, obj.index)
+        h.update(repr(obj.name).encode())
+        if isinstance(obj.dtype, pd.CategoricalDtype):
+            _hash_update(h, obj.cat.categories)
+            _hash_array(h, obj.cat.codes.to_numpy())
+        else:
+            _hash_array(h, obj.to_numpy())
+    elif isinstance(obj, pd.Index):
+        h.update(b'Index')
+        h.update(repr(obj.names).encode())
+        if isinstance(obj, pd.MultiIndex):
+            for level, codes in zip(obj.levels, obj.codes):
+                _hash_update(h, level)
+                _hash_array(h, codes)
+        else:
+            _hash_array(h, obj.to_numpy())
+    elif isinstance(obj, np.ndarray):
+        h.update(b'ndarray')
+        _hash_array(h, obj)
+    elif isinstance(obj, dict):
+        h.update(b'dict')
+        for k in sorted(obj, key=repr):
+            _hash_update(h, k)
+            _hash_update(h, obj[k])
+    elif isinstance(obj, (list, tuple, range)):
+        h.update(type(obj).__name__.encode())
+        for x in obj:
+            _hash_update(h, x)
+    elif isinstance(obj, (set, frozenset)):
+        h.update(b'set')
+        for x in sorted(obj, key=repr):
+            _hash_update(h, x)
+    elif hasattr(obj, '__cache_key__'):
+        h.update(type(obj).__qualname__.encode())
+        _hash_update(h, obj.__cache_key__())
+    elif isinstance(obj, _REPR_TYPES):
+        h.update(type(obj).__name__.encode())
+        h.update(repr(obj).encode())
+    else:
+        # 默认的repr包含内存地址, 每个进程的key都不同, 缓存永远不会命中
+        raise TypeError("无法按内容hash {} 类型的参数, 可以实现 __cache_key__() 返回可hash的内容".format(
+            type(obj).__qualname__))
+
+
+def hash_inputs(*objs):
+    """
+    输入数据与参数的hash
+
+    DataFrame / Series / ndarray按数据的二进制内容hash, dict / list / tuple / set逐个元素hash,
+    数值、字符串、时间等标量按repr. 其余对象需实现 __cache_key__(), 返回按内容hash的对象
+
+    Returns
+    -------
+    str
+
+    Raises
+    ------
+    TypeError
+        参数无法按内容hash (如默认repr包含内存地址的对象)
+    """
+    h = hashlib.sha256()
+    for obj in objs:
+        _hash_update(h, obj)
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    内容寻址的磁盘缓存
+
+    每个结果以pickle (二进制, 保留DataFrame的dtype与Categorical) 保存为 <key>.pkl,
+    key为函数名、版本与参数值(按签名绑定, 位置参数与关键字参数等价)的hash.
+    命中时更新文件的修改时间, 写入后若总大小超过max_bytes, 按修改时间删除最久未使用的结果
+
+    Parameters
+    ----------
+    path: str
+        缓存目录, 不存在时创建
+    max_bytes: int
+        缓存总大小上限, 默认4GB
+
+    Examples
+    --------
+    >>> cache = DiskCache('~/.sigrs_cache')
+    >>> fwd = cache.memoize(compounding_forward_prc)
+    >>> ret = fwd(prcs, 5, delay=1)     # 第二次调用直接读取磁盘
+    """
+    suffix = '.pkl'
+
+    def __init__(self, path, max_bytes=4 * 2 ** 30):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def key(self, func, args=(), kwargs=None, version=None):
+        """函数调用的key"""
+        bound = inspect.signature(func).bind(*args, **(kwargs or {}))
+        bound.apply_defaults()
+        name = '{}.{}'.format(func.__module__, func.__qualname__)
+        return hash_inputs(name, version, dict(bound.arguments))
+
+    def get(self, key):
+        """
+        读取结果
+
+        Returns
+        -------
+        hit: bool
+        value: object
+        """
+        file = self._file(key)
+        try:
+            with open(file, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        # 最近使用时间, 文件可能刚被其他进程清理
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            pass
+        return True, value
+
+    def put(self, key, value):
+        """写入结果, 并在超过大小上限时清理"""
+        file = self._file(key)
+        tmp = '{}.{}.tmp'.format(file, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+        self.evict()
+
+    def entries(self):
+        """缓存的结果, 按最近使用时间由旧到新"""
+        res = []
+        for x in os.scandir(self.path):
+            if x.name.endswith(self.suffix):
+                try:
+                    stat = x.stat()
+                except FileNotFoundError:
+                    continue
+                res.append((stat.st_mtime, stat.st_size, x.path))
+        return sorted(res)
+
+    def size(self):
+        return sum(x[1] for x in self.entries())
+
+    def evict(self):
+        """删除最久未使用的结果直至总大小不超过max_bytes"""
+        entries = self.entries()
+        total = sum(x[1] for x in entries)
+        for _, size, file in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, file in self.entries():
+            os.remove(file)
+
+    def memoize(self, func=None, version=None):
+        """
+        缓存函数的结果
+
+        Parameters
+        ----------
+        func: callable
+        version: optional
+            计入key, 函数的实现改变时修改version使原有的结果失效
+
+        Returns
+        -------
+        callable
+            与func的签名相同
+        """
+        if func is None:
+            return functools.partial(self.memoize, version=version)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = self.key(func, args, kwargs, version)
+            hit, value = self.get(key)
+            if not hit:
+                value = func(*args, **kwargs)
+                self.put(key, value)
+            return value
+        wrapper.cache = self
+        return wrapper
@@ -2,13 +2,143 @@
 IC analysis 
 """
 
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np 
 import pandas as pd 
 
+def _sort_panel(arr):
+    """
+    按行排序, 返回排序的下标与并列组
+
+    Returns
+    -------
+    order: np.ndarray
+        每行由小到大的下标, nan在最后
+    group: np.ndarray
+        排序后每个位置的并列组编号 (全面板唯一), 与order形状相同
+    """
+    order = np.argsort(arr, axis=1, kind='stable')
+    sorted_arr = np.take_along_axis(arr, order, axis=1)
+    new_group = np.ones(sorted_arr.shape, dtype=bool)
+    new_group[:, 1:] = sorted_arr[:, 1:] != sorted_arr[:, :-1]
+    group = (np.cumsum(new_group.ravel()) - 1).reshape(sorted_arr.shape)
+    return order, group
+
+
+def _rank_in_mask(order, group, mask):
+    """
+    由_sort_panel的结果计算mask内按行的平均排名(从1开始), mask外为nan
+
+    排序只需一次, 不同的mask只需要在排序后的位置上做cumsum与bincount
+    """
+    inc = np.take_along_axis(mask, order, axis=1)
+    pos = np.cumsum(inc, axis=1)
+    n_group = group[-1, -1] + 1 if group.size else 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_rank = np.bincount(group.ravel(), weights=(pos * inc).ravel(), minlength=n_group) / \
+            np.bincount(group.ravel(), weights=inc.ravel(), minlength=n_group)
+    res = np.empty(mask.shape)
+    np.put_along_axis(res, order, np.where(inc, avg_rank[group], np.nan), axis=1)
+    return res
+
+
+def _masked_corr(x, y, mask):
+    """按行计算mask内x与y的pearson相关系数, 有效样本少于2时为nan"""
+    n = mask.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.where(mask, x, 0.)
+        y = np.where(mask, y, 0.)
+        x = np.where(mask, x - (x.sum(axis=1) / n)[:, None], 0.)
+        y = np.where(mask, y - (y.sum(axis=1) / n)[:, None], 0.)
+        res = (x * y).sum(axis=1) / np.sqrt((x * x).sum(axis=1) * (y * y).sum(axis=1))
+    res[n < 2] = np.nan
+    return res
+
+
+def _corr_rows(x, y, mask, method, x_sort=None, y_sort=None):
+    """
+    按行计算mask内的相关系数
+
+    spearman时只使用mask内的样本排名, x_sort与y_sort为已有的_sort_panel结果
+    """
+    if method == 'spearman':
+        x = _rank_in_mask(*(_sort_panel(x) if x_sort is None else x_sort), mask)
+        y = _rank_in_mask(*(_sort_panel(y) if y_sort is None else y_sort), mask)
+    return _masked_corr(x, y, mask)
+
+
+def _ic_panel(signal, rets, lags, universe, method):
+    """
+    signal与多个收益率、多个lag的ic
+
+    Parameters
+    ----------
+    signal: pd.DataFrame
+    rets: dict
+        名称 -> date * sid的收益率
+    lags: list of int
+        收益率相对信号延后的行数(以收益率的index计)
+    universe: pd.DataFrame or None
+        在信号的日期上应用
+    method: str
+
+    Returns
+    -------
+    pd.DataFrame
+        date * (名称, lag)
+    """
+    assert method in ('pearson', 'spearman'), "method应当是pearson或spearman"
+    idx = signal.index
+    cols = signal.columns
+    for ret in rets.values():
+        idx = idx.intersection(ret.index)
+        cols = cols.intersection(ret.columns)
+    if universe is not None:
+        idx = idx.intersection(universe.index)
+        cols = cols.intersection(universe.columns)
+
+    x = signal.reindex(index=idx, columns=cols).to_numpy(dtype=float)
+    x_valid = ~np.isnan(x)
+    if universe is not None:
+        x_valid &= universe.reindex(index=idx, columns=cols).fillna(False).to_numpy(dtype=bool)
+        x = np.where(x_valid, x, np.nan)
+    # 信号只排序一次
+    x_sort = _sort_panel(x) if method == 'spearman' else None
+
+    res = {}
+    for name, ret in rets.items():
+        ret = ret.reindex(columns=cols)
+        if not ret.index.is_monotonic_increasing:
+            ret = ret.sort_index()
+        y_all = ret.to_numpy(dtype=float)
+        y_all_valid = ~np.isnan(y_all)
+        # 每个收益率只排序一次
+        if method == 'spearman':
+            y_order, y_group = _sort_panel(y_all)
+        loc = ret.index.get_indexer(idx)
+        for lag in lags:
+            # 信号日期对应的收益率行, 超出范围的为nan
+            rows = loc + lag
+            out = (rows < 0) | (rows >= len(y_all))
+            rows = np.clip(rows, 0, len(y_all) - 1)
+            y = y_all[rows]
+            y_valid = y_all_valid[rows] & ~out[:, None]
+            mask = x_valid & y_valid
+            if method == 'spearman':
+                res[(name, lag)] = _corr_rows(x, y, mask, method, x_sort, (y_order[rows], y_group[rows]))
+            else:
+                res[(name, lag)] = _corr_rows(x, y, mask, method)
+    return pd.DataFrame(res, index=idx)
+
+
 def cal_ic(signal, ret, universe=None, method='pearson'):
     """
     计算股票截面ic
 
+    在date * sid的数组上一次计算: spearman对整个面板一次排名, 相关系数由mask内的各阶矩得到,
+    与DataFrame.corrwith(axis=1)一致 (只使用信号与收益率均非nan的样本)
+
     Parameters
     ---------
     signal: pd.DataFrame
@@ -25,21 +155,141 @@ def cal_ic(signal, ret, universe=None, method='pearson'):
     pd.Series:
         时间序列ic
     """
-    idx = signal.index.intersection(ret.index)
-    cols = signal.columns.intersection(ret.columns)
-    signal = signal.copy()
-    ret = ret.copy()
+    res = _ic_panel(signal, {'ic': ret}, [0], universe, method)
+    return res.iloc[:, 0].rename(None)
 
-    if universe is not None:
-        idx = idx.intersection(universe.index)
-        cols = cols.intersection(universe.columns)
-        signal = signal.loc[idx, cols].where(universe.loc[idx, cols])
-        ret = ret.loc[idx, cols].where(universe.loc[idx, cols])
+
+def cal_ic_decay(signal, ret, lags=range(10), universe=None, method='spearman'):
+    """
+    计算ic衰减: 信号与延后lag期的收益率的截面ic
+
+    信号与每个收益率只排序一次, 不同lag只是收益率的行偏移,
+    共同有效样本内的排名由已有的排序线性时间得到
+
+    Parameters
+    ----------
+    signal: pd.DataFrame
+        date * sid的信号
+    ret: pd.DataFrame, dict
+        date * sid的收益率 (如compounding_forward_prc的结果),
+        或多个horizon的收益率 {horizon: pd.DataFrame}
+    lags: list of int
+        收益率相对信号延后的期数, 以收益率的index计, 0即为cal_ic
+    universe: pd.DataFrame
+        date * sid的股票池, 在信号的日期上应用
+    method: str
+        计算ic的方法 [pearson, spearman]
+
+    Returns
+    -------
+    pd.DataFrame
+        date * lag的ic时间序列, ret为dict时列为 (horizon, lag) 的MultiIndex.
+        res.mean()即为ic衰减曲线
+    """
+    rets = ret if isinstance(ret, dict) else {None: ret}
+    res = _ic_panel(signal, rets, list(lags), universe, method)
+    if isinstance(ret, dict):
+        res.columns = pd.MultiIndex.from_tuples(res.columns, names=['horizon', 'lag'])
     else:
-        signal = signal.loc[idx, cols]
-        ret = ret.loc[idx, cols]
+        res.columns = pd.Index([x[1] for x in res.columns], name='lag')
+    return res
+
+
+# 进程池worker中的收益率
+_worker = {}
+
+
+def _init_worker(state):
+    _worker.update(state)
+
 
-    return signal.corrwith(ret, axis=1, method=method) 
+def _ic_chunk_worker(signals):
+    return _ic_chunk(signals, **_worker)
+
+
+def _ic_chunk(signals, idx, cols, y, y_valid, method, date_chunk):
+    """
+    一组信号的ic, 按date_chunk个交易日分块计算, 每块收益率只排序一次供所有信号使用
+
+    Returns
+    -------
+    np.ndarray
+        信号 * date
+    """
+    xs = [x.reindex(index=idx, columns=cols).to_numpy(dtype=float) if isinstance(x, pd.DataFrame) else x
+          for x in signals]
+    res = np.full((len(xs), len(idx)), np.nan)
+    for start in range(0, len(idx), date_chunk):
+        rows = slice(start, start + date_chunk)
+        y_block, y_valid_block = y[rows], y_valid[rows]
+        y_sort = _sort_panel(y_block) if method == 'spearman' else None
+        for k, x in enumerate(xs):
+            x_block = np.asarray(x[rows], dtype=float)
+            mask = y_valid_block & ~np.isnan(x_block)
+            res[k, rows] = _corr_rows(x_block, y_block, mask, method, y_sort=y_sort)
+    return res
+
+
+def cal_ic_batch(signals, ret, universe=None, method='pearson', names=None, chunk_size=32, date_chunk=500,
+                 n_workers=None):
+    """
+    批量计算多个信号的截面ic
+
+    收益率与股票池只对齐一次, 按chunk_size个信号一组、date_chunk个交易日一块计算,
+    spearman时每块收益率只排序一次, 内存与chunk_size * date_chunk * sid成正比
+
+    Parameters
+    ----------
+    signals: dict, np.ndarray
+        {信号名称: date * sid的pd.DataFrame},
+        或 信号 * date * sid 的三维数组(可以是np.memmap), 需与ret的index与columns对齐
+    ret: pd.DataFrame
+        date * sid的收益率
+    universe: pd.DataFrame, optional
+        date * sid的股票池
+    method: str
+        计算ic的方法 [pearson, spearman]
+    names: list, optional
+        signals为数组时的信号名称, 默认为0开始的序列
+    chunk_size: int
+        每组信号的个数, 也是进程池中每个任务的信号个数
+    date_chunk: int
+        每块的交易日个数
+    n_workers: int, optional
+        进程数, 默认为None, 不大于1时在当前进程中依次计算
+
+    Returns
+    -------
+    pd.DataFrame
+        date * 信号的ic时间序列, index为ret (与universe) 的交易日
+    """
+    assert method in ('pearson', 'spearman'), "method应当是pearson或spearman"
+    if isinstance(signals, dict):
+        names = list(signals)
+        signals = list(signals.values())
+        idx, cols = ret.index, ret.columns
+        if universe is not None:
+            idx = idx.intersection(universe.index)
+            cols = cols.intersection(universe.columns)
+    else:
+        assert signals.ndim == 3 and signals.shape[1:] == ret.shape, "信号数组应当为 信号 * date * sid, 且与ret对齐"
+        names = list(range(len(signals))) if names is None else list(names)
+        idx, cols = ret.index, ret.columns
+
+    y = ret.reindex(index=idx, columns=cols).to_numpy(dtype=float)
+    y_valid = ~np.isnan(y)
+    if universe is not None:
+        y_valid &= universe.reindex(index=idx, columns=cols).fillna(False).to_numpy(dtype=bool)
+    state = dict(idx=idx, cols=cols, y=y, y_valid=y_valid, method=method, date_chunk=date_chunk)
+
+    chunks = [signals[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+    if n_workers is None or n_workers <= 1 or len(chunks) <= 1:
+        res = [_ic_chunk(x, **state) for x in chunks]
+    else:
+        with ProcessPoolExecutor(min(n_workers, len(chunks)), initializer=_init_worker,
+                                 initargs=(state,)) as pool:
+            res = list(pool.map(_ic_chunk_worker, chunks))
+    return pd.DataFrame(np.vstack(res).T, index=idx, columns=names)
 
 
 # ----------------------- ic 相关指标 -----------------
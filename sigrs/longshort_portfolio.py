@@ -7,9 +7,62 @@ path = os.path.dirname(os.path.dirname(__file__))
 if path not in sys.path:
     sys.path.append(path)
 
-from fast_bt import simple_bt
+import warnings
 
-def long_short_backtest(signal, prcs, universe=None, init_cash=1e8, fill_time='this_bar', fill_method='vwap', commission=None, sllipage=None):
+import numpy as np
+import pandas as pd
+
+from fast_bt import buy_and_hold
+
+
+def signal_to_weights(signal, universe=None, limits=(0.01, 0.99), gross=0.9):
+    """
+    信号转换为多空组合权重: 股票池、去极值、去均值、杠杆
+
+    在date * sid的数组上原地计算, 只在转换为数组时复制一次, 无需转置
+
+    Parameters
+    ---------
+    signal: pd.DataFrame
+        date * sid 信号
+    universe: pd.DataFrame, optional
+        股票池, 股票池内缺失的信号在去极值后填为0
+    limits: tuple, optional
+        去极值的截面分位数 (下限, 上限), None时不去极值
+    gross: float
+        多空两边权重绝对值之和
+
+    Returns
+    -------
+    pd.DataFrame
+        date * sid 权重, 每日权重之和为0
+    """
+    idx, cols = signal.index, signal.columns
+    if universe is not None:
+        idx = idx.intersection(universe.index)
+        cols = cols.intersection(universe.columns)
+    x = signal.reindex(index=idx, columns=cols).to_numpy(dtype=float, copy=True)
+    if universe is not None:
+        in_universe = universe.reindex(index=idx, columns=cols).fillna(False).to_numpy(dtype=bool)
+        x[~in_universe] = np.nan
+
+    with warnings.catch_warnings():
+        # 全为nan的交易日
+        warnings.simplefilter('ignore', RuntimeWarning)
+        # 去极值
+        if limits is not None:
+            down_thres, up_thres = np.nanquantile(x, limits, axis=1)
+            np.clip(x, down_thres[:, None], up_thres[:, None], out=x)
+        if universe is not None:
+            x[in_universe & np.isnan(x)] = 0.
+        # 去均值
+        x -= np.nanmean(x, axis=1)[:, None]
+        # 杠杆
+        x *= gross / np.nansum(np.abs(x), axis=1)[:, None]
+    return pd.DataFrame(x, index=idx, columns=cols, copy=False)
+
+
+def long_short_backtest(signal, prcs, universe=None, init_cash=1e8, fill_time='this_bar', fill_method='vwap', commission=None, sllipage=None, engine='pandas'):
     """
     对信号进行多空组合测试
 
@@ -21,31 +74,14 @@ def long_short_backtest(signal, prcs, universe=None, init_cash=1e8, fill_time='t
         MultiIndex 价格
     universe: pd.DataFrame, optional    
         股票池(force 到指定股票池，无数据为0)
+    engine: str
+        fast_bt的回测引擎, 见buy_and_hold
     
     Return
     -------
     res: pd.DataFrame   
         测试结果: cash, security_value, transaction_cost, turnover, holding_num, leverage, nav
     """
-    signal = signal.copy()
-    if universe is not None:
-        idx = signal.index.intersection(universe.index)
-        cols = signal.columns.intersection(universe.columns)
-        signal = signal.loc[idx, cols].where(universe.loc[idx, cols])
-
-    # 去极值
-    up_thres = signal.quantile(0.99, axis=1, numeric_only=True)
-    down_thres = signal.quantile(0.01, axis=1, numeric_only=True)
-    mask = signal.notna()
-    signal = signal.T 
-    signal = signal.where(signal.le(up_thres, axis=1)).fillna(up_thres)
-    signal = signal.where(signal.ge(down_thres, axis=1)).fillna(down_thres)
-    signal = signal.T.where(mask)
-    if universe is not None:
-        signal = signal.fillna(0.).loc[idx, col].where(universe.loc[idx, cols])
-
-    signal = signal.sub(signal.mean(axis=1), axis=0)
-    signal = signal.div(signal.abs().sum(axis=1), axis=0) * 0.9 
-
-    return simple_bt(signal, prcs, "longshort_sig", init_cash, fill_time, fill_method, commission, sllipage).history_summary()
-
+    weight = signal_to_weights(signal, universe)
+    return buy_and_hold(weight, prcs, "longshort_sig", init_cash, fill_time, fill_method, commission, sllipage,
+                        engine=engine).history_summary()
@@ -2,11 +2,14 @@
 return compunding
 """
 
+import os
+import json
+
 import numpy as np 
 import pandas as pd 
 
 
-def compounding_forward_prc(prcs, interval, delay=0, amount_df=None, amount_threshold=5e6):
+def compounding_forward_prc(prcs, interval, delay=0, amount_df=None, amount_threshold=5e6, chunk_size=None):
     """
     根据复权价格，计算每一交易日的forward looking收益率
 
@@ -22,12 +25,17 @@ def compounding_forward_prc(prcs, interval, delay=0, amount_df=None, amount_thre
         成交额
     amount_threshold: float
         用于判断当天是否可以成功交易的阈值
+    chunk_size: int, optional
+        给定时按chunk_size个交易日分块计算, 见forward_returns
     
     Returns
     -------
     res: pd.DataFrame
         收益率
     """
+    if chunk_size is not None:
+        res = forward_returns(prcs, [interval], delay, amount_df, amount_threshold, chunk_size=chunk_size)
+        return res[interval].dropna(how='all')
     res = prcs.shift(-delay)\
               .pct_change(periods=interval)
     if amount_df is not None:
@@ -38,7 +46,7 @@ def compounding_forward_prc(prcs, interval, delay=0, amount_df=None, amount_thre
     return res.dropna(how='all')
 
 
-def compounding_forward_ret(ret, interval, delay=0, amount_df=None, amount_threshold=5e6):
+def compounding_forward_ret(ret, interval, delay=0, amount_df=None, amount_threshold=5e6, chunk_size=None):
     """
     根据每日收益率(当日收益率为当日价格相比前一日价格)，计算每一交易日的forward looking收益率
 
@@ -54,12 +62,18 @@ def compounding_forward_ret(ret, interval, delay=0, amount_df=None, amount_thres
         成交额
     amount_threshold: float
         用于判断当天是否可以成功交易的阈值
+    chunk_size: int, optional
+        给定时按chunk_size个交易日分块计算, 见forward_returns
     
     Returns
     -------
     res: pd.DataFrame
         收益率
     """
+    if chunk_size is not None:
+        res = forward_returns(ret, [interval], delay, amount_df, amount_threshold, from_ret=True,
+                              chunk_size=chunk_size)
+        return res[interval]
     res = (ret + 1).cumprod()
     res = res.shift(-delay)\
               .pct_change(periods=interval)
@@ -70,3 +84,87 @@ def compounding_forward_ret(ret, interval, delay=0, amount_df=None, amount_thres
     res = res.shift(-interval)
     return res
 
+
+
+def forward_returns(data, intervals, delay=0, amount_df=None, amount_threshold=5e6, from_ret=False,
+                    chunk_size=500, out=None):
+    """
+    分块计算多个period的forward looking收益率
+
+    按chunk_size个交易日分块, 每块只读取 [t + delay, t + chunk_size + delay + max(intervals)) 的价格
+    (或收益率)与成交额, 一次得到所有period的收益率并写入预先分配的结果,
+    中间变量的内存与chunk_size * sid成正比. out给定时结果写入磁盘上的memmap,
+    内存占用与交易日总数无关
+
+    第t日 period为interval 的收益率为 p[t + delay + interval] / p[t + delay] - 1,
+    amount_df给定时要求t + delay与t + delay + interval日的成交额均不小于amount_threshold,
+    与compounding_forward_prc / compounding_forward_ret一致
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        date * sid 复权的价格, from_ret时为日收益率
+    intervals: int, list of int
+        收益率的period
+    delay: int
+        延后交易的天数
+    amount_df: pd.DataFrame, optional
+        成交额
+    amount_threshold: float
+        用于判断当天是否可以成功交易的阈值
+    from_ret: bool
+        data是否为日收益率, 是则在每块内累乘为价格
+    chunk_size: int
+        每块的交易日数
+    out: str, optional
+        结果目录, 每个period保存为fwd_<interval>.npy, 以及dates.npy, sids.npy, meta.json
+
+    Returns
+    -------
+    dict
+        interval -> date * sid 的收益率 (index与data相同, 不去掉全为nan的行),
+        out给定时为以只读memmap为数据的pd.DataFrame
+    """
+    intervals = sorted(set([intervals] if np.isscalar(intervals) else intervals))
+    values = data.to_numpy(dtype=float)
+    amount = None
+    if amount_df is not None:
+        amount = amount_df.reindex(index=data.index, columns=data.columns).to_numpy(dtype=float)
+    n_dates, n_sids = values.shape
+    span = max(intervals) + delay
+
+    if out is not None:
+        os.makedirs(out, exist_ok=True)
+        res = {i: np.lib.format.open_memmap(os.path.join(out, 'fwd_{}.npy'.format(i)), mode='w+',
+                                            dtype=float, shape=values.shape) for i in intervals}
+    else:
+        res = {i: np.empty(values.shape) for i in intervals}
+
+    for start in range(0, n_dates, chunk_size):
+        end = min(start + chunk_size, n_dates)
+        # 本块所需的价格窗口
+        lo, hi = min(start + delay, n_dates), min(end + span, n_dates)
+        window = values[lo:hi]
+        if from_ret:
+            prc = np.cumprod(np.where(np.isnan(window), 1., window + 1.), axis=0)
+            prc[np.isnan(window)] = np.nan
+        else:
+            prc = window
+        tradable = None if amount is None else amount[lo:hi] >= amount_threshold
+        for i in intervals:
+            k = max(0, min(end - start, hi - lo - i))
+            block = res[i][start:end]
+            block[k:] = np.nan
+            block[:k] = prc[i:i + k] / prc[:k] - 1.
+            if tradable is not None:
+                block[:k][~(tradable[:k] & tradable[i:i + k])] = np.nan
+
+    if out is not None:
+        np.save(os.path.join(out, 'dates.npy'), data.index.values)
+        np.save(os.path.join(out, 'sids.npy'), np.asarray(data.columns, dtype=str))
+        with open(os.path.join(out, 'meta.json'), 'w') as f:
+            json.dump({'fields': ['fwd_{}'.format(i) for i in intervals]}, f)
+        for i in intervals:
+            res[i].flush()
+            res[i] = np.load(os.path.join(out, 'fwd_{}.npy'.format(i)), mmap_mode='r')
+    return {i: pd.DataFrame(v, index=data.index, columns=data.columns, copy=False) for i, v in res.items()}
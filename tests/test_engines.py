@@ -0,0 +1,110 @@
+"""
+history_summary of the pandas / array / sparse / vectorized engines must agree
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_bt import BacktestDataSource, HoldingStrategy, StrategyEnvironment, VectorizedHoldingStrategy, parameter_sweep
+
+ENGINES = ('pandas', 'array', 'sparse', 'vectorized')
+
+
+def make_panel(n_dates=60, n_sids=40, holding_num=8, rebalance_every=5, seed=0):
+    """synthetic MultiIndex prices with suspensions and an equal-weight holding"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2010-01-01', periods=n_dates, name='date')
+    sids = pd.Index(['%06d' % i for i in range(n_sids)], name='sid')
+    close = 10. * np.exp(np.cumsum(rng.normal(0., 0.02, (n_dates, n_sids)), axis=0))
+    close[rng.random((n_dates, n_sids)) < 0.02] = np.nan
+    prcs = pd.DataFrame({
+        'open': (close * (1. + rng.normal(0., 0.005, close.shape))).ravel(),
+        'close': close.ravel(),
+        'vwap': (close * (1. + rng.normal(0., 0.003, close.shape))).ravel(),
+        'amount': rng.uniform(1e6, 1e8, close.shape).ravel(),
+    }, index=pd.MultiIndex.from_product([dates, sids]))
+
+    rebalance_dates = dates[::rebalance_every]
+    score = rng.random((len(rebalance_dates), n_sids))
+    selected = score >= -np.partition(-score, holding_num - 1, axis=1)[:, holding_num - 1:holding_num]
+    holding = pd.DataFrame(np.where(selected, 1. / holding_num, np.nan), index=rebalance_dates, columns=sids)
+    return prcs, holding
+
+
+def run_engine(prcs, holding, engine, corridor=0., **env_kw):
+    ds = BacktestDataSource(prcs, dense=engine != 'pandas')
+    env = StrategyEnvironment(init_cash=1e8, engine=engine, **env_kw)
+    if engine == 'vectorized':
+        str_inst = VectorizedHoldingStrategy(ds, env, 'test', holding, corridor)
+    else:
+        str_inst = HoldingStrategy(ds, env, 'test', holding, corridor)
+    str_inst.run(progress=False)
+    return str_inst
+
+
+def assert_summary_equal(actual, expected):
+    assert actual.index.equals(expected.index)
+    assert list(actual.columns) == list(expected.columns)
+    err = ((actual - expected).abs() / (expected.abs() + 1.)).max().max()
+    assert err < 1e-10, err
+
+
+@pytest.fixture(scope='module')
+def panel():
+    return make_panel()
+
+
+@pytest.mark.parametrize('engine', ENGINES[1:])
+@pytest.mark.parametrize('case', [
+    dict(),
+    dict(corridor=0.01),
+    # 成交额上限生效
+    dict(amount_scale=1e-3, max_trading_percentage=0.1),
+])
+def test_engines_agree(panel, engine, case):
+    case = dict(case)
+    prcs, holding = panel
+    prcs = prcs.assign(amount=prcs['amount'] * case.pop('amount_scale', 1.))
+    expected = run_engine(prcs, holding, 'pandas', **case).history_summary()
+    actual = run_engine(prcs, holding, engine, **case).history_summary()
+    assert_summary_equal(actual, expected)
+
+
+def test_cap_binds(panel):
+    prcs, holding = panel
+    capped = prcs.assign(amount=prcs['amount'] * 1e-3)
+    res = run_engine(capped, holding, 'array', max_trading_percentage=0.1)
+    assert len(res.history_unfilled_order()) > 0
+
+
+@pytest.mark.parametrize('engine', ENGINES[:3])
+def test_carry_over_engines_agree(panel, engine):
+    prcs, holding = panel
+    prcs = prcs.assign(amount=prcs['amount'] * 1e-3)
+    kw = dict(max_trading_percentage=0.1, carry_over=True, decay=0.5)
+    expected = run_engine(prcs, holding, 'pandas', **kw).history_summary()
+    actual = run_engine(prcs, holding, engine, **kw).history_summary()
+    assert_summary_equal(actual, expected)
+
+
+@pytest.mark.parametrize('engine', ENGINES[:3])
+def test_carry_over_decay_zero(panel, engine):
+    """decay=0 keeps nothing in the order book, same as cancelling the remainder"""
+    prcs, holding = panel
+    prcs = prcs.assign(amount=prcs['amount'] * 1e-3)
+    expected = run_engine(prcs, holding, engine, max_trading_percentage=0.1)
+    actual = run_engine(prcs, holding, engine, max_trading_percentage=0.1, carry_over=True, decay=0.)
+    assert_summary_equal(actual.history_summary(), expected.history_summary())
+    unfilled, unfilled_expected = actual.history_unfilled_order(), expected.history_unfilled_order()
+    pd.testing.assert_frame_equal(unfilled.sort_index(axis=1), unfilled_expected.sort_index(axis=1))
+
+
+def test_sweep_environment_params(panel):
+    """engine, use_numba, incremental_valuation in the grid go to StrategyEnvironment"""
+    prcs, holding = panel
+    grid = {'engine': ['array', 'sparse'], 'use_numba': [True, False], 'incremental_valuation': [False, True]}
+    res = parameter_sweep(lambda: holding, grid, prcs, n_workers=1)
+    expected = run_engine(prcs, holding, 'pandas').history_summary()
+    for key, summary in res.groupby(level=[0, 1, 2]):
+        assert_summary_equal(summary.droplevel([0, 1, 2]), expected)
@@ -0,0 +1,112 @@
+"""
+sigrs的向量化实现与逐截面(groupby)参考实现一致
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sigrs import ic, bucket_portfolio, long_short_backtest
+
+from test_engines import make_panel, assert_summary_equal
+
+
+def _ref_ic(signal, ret, universe, method):
+    """逐日计算的截面ic"""
+    signal, ret = signal.where(universe), ret.where(universe)
+    if method == 'pearson':
+        return signal.corrwith(ret, axis=1)
+    res = dict()
+    for t in signal.index:
+        x, y = signal.loc[t], ret.loc[t]
+        m = x.notna() & y.notna()
+        res[t] = x[m].rank().corr(y[m].rank()) if m.sum() > 1 else np.nan
+    return pd.Series(res)
+
+
+def _ref_bucket_ret(sort, ret, weight=None, delay=1):
+    """原逐组构建DataFrame的实现"""
+    sort, ret = sort.align(ret.loc[:, sort.columns], join='right')
+    sort = sort.ffill().shift(delay).dropna(how='all')
+    if weight is None:
+        weight = pd.DataFrame(1., index=sort.index, columns=sort.columns)
+    else:
+        weight = weight.loc[:, sort.columns].reindex(ret.index).ffill().shift(delay).loc[sort.index]
+    ret = ret.loc[sort.index]
+
+    groups = np.unique(sort).tolist()
+    if 'nan' in groups:
+        groups.remove('nan')
+    mask = np.logical_and(sort.notna(), ret.notna())
+    res = pd.DataFrame(index=sort.index, columns=groups, dtype=float)
+    for gp in groups:
+        w = weight.where(sort == gp)
+        res[gp] = (ret.where(sort == gp).where(mask) * w).sum(axis=1) / w.where(mask).sum(axis=1)
+    res['all'] = (ret.where(mask) * weight).sum(axis=1) / weight.where(mask).sum(axis=1)
+    return res
+
+
+def _panel(n_dates, n_sids, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2020-01-01', periods=n_dates)
+    sids = ['%06d' % i for i in range(n_sids)]
+    return rng, dates, sids
+
+
+@pytest.mark.parametrize('method', ['pearson', 'spearman'])
+def test_cal_ic(method):
+    rng, dates, sids = _panel(40, 60)
+    shape = (len(dates), len(sids))
+    # round产生并列值
+    signal = pd.DataFrame(rng.normal(size=shape), index=dates, columns=sids).round(1)
+    signal = signal.where(rng.random(shape) > 0.1)
+    signal.iloc[5, :-1] = np.nan
+    ret = pd.DataFrame(rng.normal(size=shape), index=dates, columns=sids).where(rng.random(shape) > 0.05)
+    ret.iloc[3] = np.nan
+    universe = pd.DataFrame(rng.random(shape) > 0.2, index=dates, columns=sids)
+
+    expected = _ref_ic(signal, ret, universe, method)
+    actual = ic.cal_ic(signal, ret, universe, method=method)
+    pd.testing.assert_series_equal(actual, expected, check_names=False, check_freq=False, atol=1e-12)
+
+
+@pytest.mark.parametrize('cut, group', [(4, None), ([0., 0.3, 0.7, 1.], None), (5, 'ind')])
+def test_cal_sort_quantile(cut, group):
+    rng, dates, sids = _panel(20, 200)
+    idx = pd.MultiIndex.from_product([dates, sids], names=['date', 'sid'])
+    df = pd.DataFrame({'x': rng.normal(size=len(idx)), 'ind': rng.choice(list('abc'), len(idx))}, index=idx)
+    df.loc[rng.random(len(idx)) < 0.05, 'x'] = np.nan
+
+    keys = ['date'] if group is None else ['date', group]
+    expected = df.groupby(keys)['x'].transform(lambda x: pd.qcut(x, cut, labels=False))
+    expected = expected.fillna(-1).astype(np.int64)
+    actual = bucket_portfolio.cal_sort_quantile(df, 'x', cut, group, return_codes=True)
+    np.testing.assert_array_equal(actual.to_numpy(), expected.reindex(actual.index).to_numpy())
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_cal_bucket_ret(weighted):
+    rng, dates, sids = _panel(120, 50)
+    shape = (len(dates), len(sids))
+    ret = pd.DataFrame(rng.normal(0., 0.02, shape), index=dates, columns=sids).where(rng.random(shape) > 0.03)
+    mdates = dates[::21]
+    sort = pd.DataFrame(rng.integers(1, 6, (len(mdates), len(sids))), index=mdates, columns=sids).astype(str)
+    sort = sort.where(rng.random(sort.shape) > 0.05, 'nan')
+    weight = None
+    if weighted:
+        weight = pd.DataFrame(rng.uniform(1., 10., sort.shape), index=mdates, columns=sids)
+        weight = weight.where(rng.random(sort.shape) > 0.02)
+
+    expected = _ref_bucket_ret(sort, ret, weight)
+    actual = bucket_portfolio.cal_bucket_ret(sort, ret, weight, chunk_size=30)
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual, expected, check_freq=False, check_names=False, atol=1e-12)
+
+
+def test_long_short_backtest_engines():
+    prcs, holding = make_panel()
+    rng = np.random.default_rng(0)
+    signal = pd.DataFrame(rng.normal(size=holding.shape), index=holding.index, columns=holding.columns)
+    expected = long_short_backtest(signal, prcs)
+    actual = long_short_backtest(signal, prcs, engine='array')
+    assert_summary_equal(actual, expected)